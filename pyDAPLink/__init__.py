@@ -19,7 +19,7 @@ from .server import DAPLinkServer
 from .client import DAPLinkClient
 from .client import READ_NOW, READ_START, READ_END
 from .daplink import AP_REG, DP_REG
-from .errors import TransferError, CommandError
+from .errors import TransferError, CommandError, PollTimeout
 
 # alias DAPLinkClient as main DAPLink class
 DAPLink = DAPLinkClient
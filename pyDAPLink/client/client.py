@@ -20,8 +20,8 @@ from ..interface import INTERFACE, default_interface
 from ..socket import SOCKET, socket_by_address, default_socket
 from ..utility import encode, decode
 from ..utility import popen_and_detach
-from ..errors import CommandError, ServerError, TransferError
-from time import sleep
+from ..errors import CommandError, ServerError, TransferError, TimeoutError
+from time import sleep, time
 import logging
 
 from .._version import version as __version__
@@ -35,7 +35,12 @@ class DAPLinkClient(object):
     specific payload.
     """
     def __init__(self, address=None, socket=None, interface=None,
-                       create_server=True, connect_attempts=5):
+                       create_server=True, connect_attempts=5,
+                       profile=None, compression=None):
+        """
+        If compression is a size in bytes, messages at least that long
+        are compressed with zlib if the server supports it.
+        """
         if interface:
             interface = INTERFACE[interface]
         else:
@@ -48,13 +53,24 @@ class DAPLinkClient(object):
         else:
             socket = default_socket
 
+        options = {}
+        if profile:
+            if profile not in socket.profiles:
+                raise ValueError('No %s profile for %s sockets' %
+                                 (profile, socket.name))
+            options['profile'] = profile
+
         if address:
-            self._client = socket.Client(address)
+            self._client = socket.Client(address, **options)
         else:
-            self._client = socket.Client()
+            self._client = socket.Client(**options)
 
         self.interface = interface.name
         self.socket = socket.name
+        self.profile = profile
+        self.compression = compression
+        # Smallest message compressed once the server agreed to it
+        self._threshold = None
         self._create_server = create_server
         self._connect_attempts = connect_attempts
 
@@ -73,7 +89,8 @@ class DAPLinkClient(object):
                         '--temporary',
                         '--address', self.address,
                         '--socket', self.socket,
-                        '--interface', self.interface])
+                        '--interface', self.interface] +
+                        (['--profile', self.profile] if self.profile else []))
                 sleep(0.1)
                 attempts += 1
         else:
@@ -81,7 +98,13 @@ class DAPLinkClient(object):
 
         # Check the server's version, this also determines if the server 
         # is actually a daplink server
-        server_info = self.command('server_info')
+        info = {}
+        if self.compression is not None:
+            info = {'compression': ['zlib'], 'threshold': self.compression}
+
+        server_info = self.command('server_info', info)
+        if server_info.get('compression') == 'zlib':
+            self._threshold = self.compression
 
         if server_info['version'] != __version__:
             logging.warning('Server and client are not the same version')
@@ -96,9 +119,10 @@ class DAPLinkClient(object):
     def command(self, command, data={}):
         data['command'] = command
 
-        self._client.send(encode(data))
+        self._client.send(encode(data, self._threshold))
 
-        resp = decode(self._client.recv())
+        # The server only compresses if asked to
+        resp = decode(self._client.recv(), self.compression is not None)
         if not self._client.isalive():
             raise IOError("Server disconnected")
 
@@ -107,6 +131,8 @@ class DAPLinkClient(object):
                 raise CommandError(resp['message'])
             elif resp['error'] == 'TransferError':
                 raise TransferError(resp['message'])
+            elif resp['error'] == 'TimeoutError':
+                raise TimeoutError(resp['message'])
             else:
                 raise ServerError(resp['error'], resp['message'])
         elif 'response' not in resp or resp['response'] != command:
@@ -114,11 +140,74 @@ class DAPLinkClient(object):
 
         return resp
 
-    def getConnectedBoards(self, vid, pid):
-        data = self.command('board_enumerate', {'vid': vid, 'pid': pid})
+    def getServerStats(self):
+        """
+        Returns the server's statistics per client and per board,
+        including this client's id on the server.
+        """
+        data = self.command('server_stats')
+        del data['response']
+        return data
+
+    def ping(self, size=0, payload=0):
+        """
+        Sends payload bytes to the server and receives size bytes back,
+        returns the round trip time in seconds.
+        """
+        data = {}
+        if payload:
+            data['payload'] = 'x' * payload
+        if size:
+            data['size'] = size
+
+        start = time()
+        self.command('ping', data)
+        return time() - start
+
+    def getConnectedBoards(self, vid, pid, refresh=False):
+        """
+        Returns the boards connected to the server. The server tracks
+        added and removed boards, refresh forces it to rescan them.
+        """
+        data = self.command('board_enumerate', {'vid': vid, 'pid': pid,
+                                                'refresh': refresh,
+                                                'info': True})
+
+        if 'boards' in data:
+            return [DAPLinkClientTransport(self, vid, pid, info['id'], info)
+                    for info in data['boards']]
 
         boards = [DAPLinkClientTransport(self, vid, pid, id)
                   for id in data['ids']]
 
         return boards
 
+    def findBoard(self, vid, pid, serial):
+        """
+        Returns the connected board with the specified serial number,
+        or None if there is no such board.
+        """
+        data = self.command('board_find', {'vid': vid, 'pid': pid,
+                                           'serial': serial})
+
+        if data['id'] is None:
+            return None
+
+        return DAPLinkClientTransport(self, vid, pid, data['id'], data['board'])
+
+    def getBoard(self, vid, pid, id):
+        """
+        Returns the board with an id from an earlier enumeration,
+        or None if there is no such board. Ids are kept across server
+        restarts if the server keeps an index of boards.
+        """
+        try:
+            info = self.command('board_info', {'vid': vid, 'pid': pid,
+                                               'id': id})
+        except ServerError as err:
+            if err.type == 'KeyError':
+                return None
+            raise
+
+        return DAPLinkClientTransport(self, vid, pid, id, info)
+
@@ -15,7 +15,7 @@
  limitations under the License.
 """
 
-from ..errors import CommandError
+from ..errors import CommandError, ServerError, PollTimeout
 import client
 import logging
 
@@ -36,16 +36,19 @@ class DAPLinkClientTransport(object):
     Returned from DAPLinkClient.getConnectedBoards, 
     must be initialized before use.
     """
-    def __init__(self, client, vid, pid, iid):
+    def __init__(self, client, vid, pid, iid, info=None):
         self._client = client
         self.vid = vid
         self.pid = pid
         self.iid = iid
 
-        info = self._command('board_info', {'id': iid})
+        # Board information may already be known from enumeration
+        if info is None:
+            info = self._command('board_info', {'id': iid})
         self.vendor_name = info['vendor']
         self.product_name = info['product']
         self.serial_number = info['serial']
+        self.busy = info.get('busy', False)
 
         self._nested_locks = 0
         self.deferred_transfer = False
@@ -56,10 +59,14 @@ class DAPLinkClientTransport(object):
                 (self.__class__.__name__, self.vid, self.pid, self.iid))
 
     def init(self, frequency=None, packet_count=None,
-             lock_attempts=5, new_socket=True):
+             lock_attempts=5, new_socket=True, timeout=None):
         """ 
         Initialize daplink connection to a specific device. 
 
+        Commands raise TimeoutError if the probe does not respond within
+        timeout milliseconds, after which the board must be initialized
+        again.
+
         By default, a new socket connection is created to more easily
         manage devices on the server's end. If new_socket is false,
         the client that created this connection must be kept alive.
@@ -68,16 +75,22 @@ class DAPLinkClientTransport(object):
         self._new_socket = new_socket
 
         if new_socket:
-            self._client = client.DAPLinkClient(self._client.address, False)
+            self._client = client.DAPLinkClient(self._client.address,
+                                                socket=self._client.socket,
+                                                profile=self._client.profile,
+                                                compression=self._client.compression,
+                                                create_server=False)
             self._client.init()
-            self._client.command('board_enumerate', {'vid': self.vid, 'pid': self.pid})
+            # Nothing is selected on a new connection
+            self._nested_locks = 0
 
         # We default to locking the device. It can be explicitly unlocked
         # to allow multiprocess access
         self.lock()
         self._command('dap_init', {k: v for k, v in
                                    [('frequency', frequency),
-                                    ('packet_count', packet_count)] if v})
+                                    ('packet_count', packet_count),
+                                    ('timeout', timeout)] if v})
 
     def uninit(self):
         with self:
@@ -105,7 +118,9 @@ class DAPLinkClientTransport(object):
 
         while (not self._lock_attempts or attempts < self._lock_attempts):
             try:
-                data = self._command('board_select', {'id': self.iid})
+                data = self._command('board_select', {'vid': self.vid,
+                                                      'pid': self.pid,
+                                                      'id': self.iid})
 
                 if data['selected']:
                     return
@@ -169,6 +184,14 @@ class DAPLinkClientTransport(object):
         with self:
             self._command('dap_packet_count', {'packet_count': packet_count})
 
+    def dumpTrace(self):
+        """
+        Dumps the packets the server recorded for this board,
+        returns the path of the trace file on the server's host.
+        """
+        with self:
+            return self._command('dap_trace')['path']
+
     def setDeferredTransfer(self, enable):
         """
         Allow transfers to be delayed and buffered
@@ -244,6 +267,29 @@ class DAPLinkClientTransport(object):
             self._command('read_block', {'addr': addr, 'count': count})
             return self._read()
 
+    def pollUntil(self, addr, mask, value, type=32,
+                  interval=0, timeout=1000):
+        """
+        Reads a register or memory location on the server until its
+        value masked with mask equals value. Returns the value, only its
+        masked bits if the probe matched it. Type is 'dp', 'ap', or the
+        transfer size of memory reads. Interval and timeout are in
+        milliseconds, raises PollTimeout if the value doesn't match in
+        time. Unlike TimeoutError the board stays initialized.
+        """
+        with self:
+            data = self._command('poll_until', {'addr': addr, 'mask': mask,
+                                                'value': value, 'type': type,
+                                                'interval': interval,
+                                                'timeout': timeout})
+            if 'reads' in data:
+                self._buffer.extend(data['reads'])
+
+        if not data['matched']:
+            raise PollTimeout('0x%x is 0x%x after %d ms' %
+                               (addr, data['value'], timeout))
+        return data['value']
+
     def _write(self):
         """
         Complete write command
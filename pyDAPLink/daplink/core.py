@@ -15,10 +15,10 @@
  limitations under the License.
 """
 
-from .protocol import CMSIS_DAP
-from ..errors import TransferError
+from .protocol import CMSIS_DAP, maxTransferCount, READ_TIMEOUT
+from ..errors import TransferError, MismatchError
 import logging
-from time import sleep
+from time import sleep, time
 
 # !! This value are A[2:3] and not A[3:2]
 DP_REG = {'IDCODE' : 0x00,
@@ -69,6 +69,9 @@ TRANSFER_SIZE = {8: CSW_SIZE8,
                  32: CSW_SIZE32
                  }
 
+# Reads the probe retries before reporting a value mismatch
+MATCH_RETRY = 0x0400
+
 # Response values to DAP_Connect command
 DAP_MODE_SWD = 1
 DAP_MODE_JTAG = 2
@@ -78,15 +81,14 @@ CTRLSTAT_STICKYORUN = 0x00000002
 CTRLSTAT_STICKYCMP = 0x00000010
 CTRLSTAT_STICKYERR = 0x00000020
 
-COMMANDS_PER_DAP_TRANSFER = 12
-
 
 class DAPLinkCore(object):
     """
     This class implements the CMSIS-DAP protocol
     """
-    def __init__(self, interface):
-        self._protocol = CMSIS_DAP(interface)
+    def __init__(self, interface, timeout = READ_TIMEOUT):
+        self._protocol = CMSIS_DAP(interface, timeout)
+        self._transfer_count = maxTransferCount(interface.getPacketSize())
         self._csw = -1
         self._dp_select = -1
 
@@ -103,7 +105,7 @@ class DAPLinkCore(object):
         # set clock frequency
         self._protocol.setSWJClock(frequency)
         # configure transfer
-        self._protocol.transferConfigure()
+        self._protocol.transferConfigure(match_retry = MATCH_RETRY)
 
         if (self.mode == DAP_MODE_SWD):
             # configure swd protocol
@@ -265,6 +267,58 @@ class DAPLinkCore(object):
             self.clearStickyErr()
             raise
 
+    def waitForValue(self, addr, mask, value, type = 32,
+                     interval = 0, timeout = 1000):
+        """
+        Waits until the value at addr masked with mask equals value. The
+        probe retries the read itself, if it gives up the read is polled
+        from the host every interval milliseconds until timeout
+        milliseconds pass. The kind of read is dp, ap, or 8, 16 or 32 for
+        memory. Returns value masked with mask if the probe matched it,
+        otherwise the last value read from the host.
+        """
+        # Earlier reads are sent first, their results are kept for flush
+        self._flush()
+
+        shift = 0
+        if type == 'dp':
+            request = DP_ACC | (addr & A32)
+        elif type == 'ap':
+            self.writeDP(DP_REG['SELECT'], addr & (APSEL | APBANKSEL))
+            request = AP_ACC | (addr & A32)
+        else:
+            # Without auto increment every read is of the same address
+            self.writeAP(AP_REG['CSW'], (CSW_VALUE & ~CSW_ADDRINC) |
+                                        TRANSFER_SIZE[type])
+            self._write(WRITE | AP_ACC | AP_REG['TAR'], addr)
+            request = AP_ACC | AP_REG['DRW']
+            if type == 8:
+                shift = (addr & 0x03) << 3
+            elif type == 16:
+                shift = (addr & 0x02) << 3
+
+        size_mask = (1 << type) - 1 if type in (8, 16) else 0xffffffff
+        mask &= size_mask
+        value &= mask
+
+        # The probe's retries count towards the timeout
+        deadline = time() + timeout / 1000.0
+        try:
+            self._write(WRITE | MATCH_MASK, mask << shift)
+            self._write(READ | VALUE_MATCH | request, value << shift)
+            self._flush()
+            # Value match reads don't return data, only the masked bits
+            # are known
+            return value
+        except MismatchError:
+            while True:
+                result = self._readNow(READ | request)
+                if ((result >> shift) & mask) == value or time() >= deadline:
+                    break
+                sleep(interval / 1000.0)
+
+        return (result >> shift) & size_mask
+
     def reset(self):
         self._flush()
         self._protocol.setSWJPins(0, 'nRESET')
@@ -309,7 +363,7 @@ class DAPLinkCore(object):
         transfer_count = len(self._request_list)
 
         if transfer_count > 0:
-            assert transfer_count <= COMMANDS_PER_DAP_TRANSFER
+            assert transfer_count <= self._transfer_count
             try:
                 resp = self._protocol.transfer(
                         transfer_count, self._request_list, self._data_list)
@@ -327,6 +381,11 @@ class DAPLinkCore(object):
                 # Clear error
                 self.clearStickyErr()
                 raise
+            except MismatchError:
+                # Commands after the value match read are not run
+                self._request_list = []
+                self._data_list = []
+                raise
 
             self._request_list = []
             self._data_list = []
@@ -339,9 +398,23 @@ class DAPLinkCore(object):
         self._data_list.append(data)
 
         transfer_count = len(self._request_list)
-        if (transfer_count >= COMMANDS_PER_DAP_TRANSFER):
+        if (transfer_count >= self._transfer_count):
             self._flush()
 
+    def _readNow(self, request):
+        """
+        Read a single register immediately, without a handler
+        """
+        self._write(request)
+        self._flush()
+
+        resp = self._response_list[-4:]
+        del self._response_list[-4:]
+        return ((resp[0] << 0)  |
+                (resp[1] << 8)  |
+                (resp[2] << 16) |
+                (resp[3] << 24))
+
     def _read(self, count, handler):
         """
         Register a handler for the response from a single command
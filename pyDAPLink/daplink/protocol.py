@@ -17,7 +17,7 @@
 
 import logging
 import array
-from ..errors import TransferError
+from ..errors import TransferError, MismatchError
 
 COMMAND_ID = {'DAP_INFO': 0x00,
               'DAP_LED': 0x01,
@@ -71,13 +71,26 @@ DAP_ERROR = 0xff
 DAP_TRANSFER_OK = 1
 DAP_TRANSFER_WAIT = 2
 DAP_TRANSFER_FAULT = 4
+DAP_TRANSFER_MISMATCH = 0x10
 
-MAX_PACKET_SIZE = 0x0E
+# Default deadline for responses in milliseconds
+READ_TIMEOUT = 5000
+
+# Largest DAP_TransferBlock that fits in a packet of the given size
+def maxBlockCount(packet_size):
+    return (packet_size - 5) // 4
+
+# Largest DAP_Transfer that fits in a packet of the given size
+def maxTransferCount(packet_size):
+    return (packet_size - 3) // 5
 
 ## @brief This class implements the CMSIS-DAP wire protocol.
 class CMSIS_DAP(object):
-    def __init__(self, interface):
+    def __init__(self, interface, timeout = READ_TIMEOUT):
+        # Reads raise TimeoutError if the probe does not
+        # respond within timeout milliseconds
         self.interface = interface
+        self.timeout = timeout
 
     def dapInfo(self, id_):
         cmd = []
@@ -85,7 +98,7 @@ class CMSIS_DAP(object):
         cmd.append(ID_INFO[id_])
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_INFO']:
             raise ValueError('DAP_INFO response error')
 
@@ -114,7 +127,7 @@ class CMSIS_DAP(object):
         cmd.append(mode)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_CONNECT']:
             raise ValueError('DAP_CONNECT response error')
 
@@ -134,7 +147,7 @@ class CMSIS_DAP(object):
         cmd.append(COMMAND_ID['DAP_DISCONNECT'])
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_DISCONNECT']:
             raise ValueError('DAP_DISCONNECT response error')
 
@@ -153,7 +166,7 @@ class CMSIS_DAP(object):
         cmd.append((data >> 24) & 0xff)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_WRITE_ABORT']:
             raise ValueError('DAP_WRITE_ABORT response error')
 
@@ -167,7 +180,7 @@ class CMSIS_DAP(object):
         cmd.append(COMMAND_ID['DAP_RESET_TARGET'])
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_RESET_TARGET']:
             raise ValueError('DAP_RESET_TARGET response error')
 
@@ -186,7 +199,7 @@ class CMSIS_DAP(object):
         cmd.append(match_retry >> 8)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_TRANSFER_CONFIGURE']:
             raise ValueError('DAP_TRANSFER_CONFIGURE response error')
 
@@ -203,7 +216,9 @@ class CMSIS_DAP(object):
         count_write = count
         for i in range(count):
             cmd.append(request[i])
-            if not ( request[i] & ((1 << 1) | (1 << 4))):
+            # Writes and value match reads carry data, other reads
+            # return it
+            if not (request[i] & (1 << 1)) or request[i] & (1 << 4):
                 cmd.append(data[i] & 0xff)
                 cmd.append((data[i] >> 8) & 0xff)
                 cmd.append((data[i] >> 16) & 0xff)
@@ -211,10 +226,13 @@ class CMSIS_DAP(object):
                 count_write -= 1
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_TRANSFER']:
             raise ValueError('DAP_TRANSFER response error')
 
+        if resp[2] & DAP_TRANSFER_MISMATCH:
+            raise MismatchError()
+
         if resp[2] != DAP_TRANSFER_OK:
             if resp[2] == DAP_TRANSFER_FAULT:
                 raise TransferError()
@@ -230,6 +248,7 @@ class CMSIS_DAP(object):
     def transferBlock(self, count, request, data = [0], dap_index = 0):
         packet_count = count
         max_pending_reads = self.interface.getPacketCount()
+        max_block_count = maxBlockCount(self.interface.getPacketSize())
         reads_pending = 0
         nb = 0
         resp = []
@@ -243,25 +262,25 @@ class CMSIS_DAP(object):
                 cmd = []
                 cmd.append(COMMAND_ID['DAP_TRANSFER_BLOCK'])
                 cmd.append(dap_index)
-                packet_written = min(packet_count, MAX_PACKET_SIZE)
+                packet_written = min(packet_count, max_block_count)
                 cmd.append(packet_written & 0xff)
                 cmd.append((packet_written >> 8) & 0xff)
                 cmd.append(request)
                 if not (request & ((1 << 1))):
                     for i in range(packet_written):
-                        cmd.append(data[i + nb*MAX_PACKET_SIZE] & 0xff)
-                        cmd.append((data[i + nb*MAX_PACKET_SIZE] >> 8) & 0xff)
-                        cmd.append((data[i + nb*MAX_PACKET_SIZE] >> 16) & 0xff)
-                        cmd.append((data[i + nb*MAX_PACKET_SIZE] >> 24) & 0xff)
+                        cmd.append(data[i + nb*max_block_count] & 0xff)
+                        cmd.append((data[i + nb*max_block_count] >> 8) & 0xff)
+                        cmd.append((data[i + nb*max_block_count] >> 16) & 0xff)
+                        cmd.append((data[i + nb*max_block_count] >> 24) & 0xff)
                 self.interface.write(cmd)
-                packet_count = packet_count - MAX_PACKET_SIZE
+                packet_count = packet_count - max_block_count
                 nb = nb + 1
                 reads_pending = reads_pending + 1
 
             # Read data
             if reads_pending > 0:
                 # we then read
-                tmp = self.interface.read()
+                tmp = self.interface.read(timeout=self.timeout)
                 if tmp[0] != COMMAND_ID['DAP_TRANSFER_BLOCK']:
                     # Error occurred - abort further writes
                     # but make sure to finish reading remaining packets
@@ -298,7 +317,7 @@ class CMSIS_DAP(object):
         cmd.append((clock >> 24) & 0xff)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_SWJ_CLOCK']:
                 raise ValueError('DAP_SWJ_CLOCK response error')
 
@@ -323,7 +342,7 @@ class CMSIS_DAP(object):
         cmd.append((wait >> 24) & 0xff)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_SWJ_PINS']:
                 raise ValueError('DAP_SWJ_PINS response error')
 
@@ -335,7 +354,7 @@ class CMSIS_DAP(object):
         cmd.append(conf)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_SWD_CONFIGURE']:
                 raise ValueError('DAP_SWD_CONFIGURE response error')
 
@@ -352,7 +371,7 @@ class CMSIS_DAP(object):
             cmd.append(data[i])
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_SWJ_SEQUENCE']:
                 raise ValueError('DAP_SWJ_SEQUENCE response error')
 
@@ -369,7 +388,7 @@ class CMSIS_DAP(object):
         cmd.append(tdi)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_JTAG_SEQUENCE']:
             raise ValueError('DAP_JTAG_SEQUENCE response error')
 
@@ -385,7 +404,7 @@ class CMSIS_DAP(object):
         cmd.append(irlen)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_JTAG_CONFIGURE']:
             raise ValueError('DAP_JTAG_CONFIGURE response error')
 
@@ -400,7 +419,7 @@ class CMSIS_DAP(object):
         cmd.append(index)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
         if resp[0] != COMMAND_ID['DAP_JTAG_IDCODE']:
             raise ValueError('DAP_JTAG_IDCODE response error')
 
@@ -417,7 +436,7 @@ class CMSIS_DAP(object):
         cmd.append(COMMAND_ID['DAP_VENDOR0'] + index)
         self.interface.write(cmd)
 
-        resp = self.interface.read()
+        resp = self.interface.read(timeout=self.timeout)
 
         if resp[0] != COMMAND_ID['DAP_VENDOR0'] + index:
             raise ValueError('DAP_VENDOR response error')
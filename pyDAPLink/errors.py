@@ -18,9 +18,18 @@
 class TransferError(ValueError):
     pass
 
+class MismatchError(ValueError):
+    pass
+
 class CommandError(ValueError):
     pass
 
+class PollTimeout(CommandError):
+    pass
+
+class TimeoutError(IOError):
+    pass
+
 class ServerError(IOError):
     def __init__(self, type, message):
         self.type = type
@@ -18,17 +18,24 @@
 import os
 import logging
 from hidapi_backend import HidApiUSB
+from hidraw_backend import HidrawUSB
 from pyusb_backend import PyUSB
+from pyusb_v2_backend import PyUSBv2
 from pywinusb_backend import PyWinUSB
+from simulated_backend import SimulatedUSB
+from replay_backend import ReplayUSB
 
 INTERFACE = \
     { backend.name: backend
-      for backend in (HidApiUSB, PyUSB, PyWinUSB)
+      for backend in (HidApiUSB, HidrawUSB, PyUSB, PyUSBv2, PyWinUSB,
+                      SimulatedUSB, ReplayUSB)
       if backend.available }
 
-# Default interfaces defined in order of preference
+# Default interfaces defined in order of preference,
+# the PYDAPLINK_INTERFACE environment variable takes precedence
 default_interface = \
     next(INTERFACE[name]
-         for name in ('hidapiusb', 'pyusb', 'pywinusb')
+         for name in (os.environ.get('PYDAPLINK_INTERFACE'),
+                      'hidapiusb', 'hidraw', 'pyusb', 'pywinusb', 'simulated')
          if name in INTERFACE)
 
@@ -0,0 +1,63 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+# HID short item types and tags
+ITEM_MAIN = 0
+ITEM_GLOBAL = 1
+
+MAIN_INPUT = 0x8
+MAIN_OUTPUT = 0x9
+GLOBAL_REPORT_SIZE = 0x7
+GLOBAL_REPORT_COUNT = 0x9
+
+ITEM_LONG = 0xfe
+
+
+def reportSizes(descriptor):
+    """
+    Parses a HID report descriptor,
+    returns the input and output report sizes in bytes.
+    """
+    descriptor = bytearray(descriptor)
+    sizes = {MAIN_INPUT: 0, MAIN_OUTPUT: 0}
+    report_size = 0
+    report_count = 0
+    i = 0
+
+    while i < len(descriptor):
+        prefix = descriptor[i]
+        if prefix == ITEM_LONG:
+            # Long items are never used for report sizes
+            i += 3 + descriptor[i+1]
+            continue
+
+        size = (0, 1, 2, 4)[prefix & 0x3]
+        type = (prefix >> 2) & 0x3
+        tag = prefix >> 4
+        value = 0
+        for j, byte in enumerate(descriptor[i+1:i+1+size]):
+            value |= byte << (8*j)
+        i += 1 + size
+
+        if type == ITEM_GLOBAL and tag == GLOBAL_REPORT_SIZE:
+            report_size = value
+        elif type == ITEM_GLOBAL and tag == GLOBAL_REPORT_COUNT:
+            report_count = value
+        elif type == ITEM_MAIN and tag in sizes:
+            sizes[tag] += report_size * report_count
+
+    return sizes[MAIN_INPUT] // 8, sizes[MAIN_OUTPUT] // 8
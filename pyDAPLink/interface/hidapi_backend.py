@@ -16,6 +16,10 @@
 """
 
 from interface import Interface
+from hid_report import reportSizes
+from hotplug import udevHotplug
+from ..daplink.protocol import CMSIS_DAP
+from ..errors import TimeoutError
 import logging, os
 
 try:
@@ -39,25 +43,46 @@ class HidApiUSB(Interface):
     """
     name = 'hidapiusb'
     available = available
+    hotplug = staticmethod(udevHotplug)
 
     def __init__(self):
         super(HidApiUSB, self).__init__()
         # Vendor page and usage_id = 2
         self.device = None
+        self.setPacketSize(self.packet_size)
 
     def open(self):
+        # Devices are only opened once a board is used
+        if self.device is None:
+            device = hid.device()
+            device.open_path(self.path)
+            self.device = device
+
+        self.setPacketSize(self.reportSize())
+
+    def reportSize(self):
+        """
+        Size of the device's reports, from the report descriptor when
+        hidapi can provide it, otherwise from DAP_Info.
+        """
         try:
-            self.device.open(self.vid, self.pid)
-        except AttributeError:
+            _, size = reportSizes(self.device.get_report_descriptor())
+            if size:
+                return size
+        except (AttributeError, IOError):
             pass
 
+        # Every CMSIS-DAP probe accepts 64 byte reports
+        self.setPacketSize(64)
+        return CMSIS_DAP(self).dapInfo('PACKET_SIZE') or 64
+
     @staticmethod
     def getConnectedInterfaces(vid, pid):
         """
         returns all the connected devices which matches HidApiUSB.vid/HidApiUSB.pid.
         returns an array of HidApiUSB (Interface) objects
         """
-
+        # Only the enumerated metadata is used, devices are opened in open
         devices = hid.enumerate(vid, pid)
 
         if not devices:
@@ -68,20 +93,17 @@ class HidApiUSB(Interface):
 
         for deviceInfo in devices:
             try:
-                dev = hid.device(vendor_id=vid, product_id=pid, path = deviceInfo['path'])
-            except IOError:
-                logging.debug("Failed to open Mbed device")
-                return
-
-            # Create the USB interface object for this device.
-            new_board = HidApiUSB()
-            new_board.vendor_name = deviceInfo['manufacturer_string']
-            new_board.product_name = deviceInfo['product_string']
-            new_board.serial_number = deviceInfo['serial_number']
-            new_board.vid = deviceInfo['vendor_id']
-            new_board.pid = deviceInfo['product_id']
-            new_board.path = deviceInfo['path']
-            new_board.device = dev
+                # Create the USB interface object for this device.
+                new_board = HidApiUSB()
+                new_board.vendor_name = deviceInfo['manufacturer_string']
+                new_board.product_name = deviceInfo['product_string']
+                new_board.serial_number = deviceInfo['serial_number']
+                new_board.vid = deviceInfo['vendor_id']
+                new_board.pid = deviceInfo['product_id']
+                new_board.path = deviceInfo['path']
+            except KeyError as e:
+                logging.debug("Skipping Mbed device without %s", e)
+                continue
 
             boards.append(new_board)
 
@@ -91,28 +113,41 @@ class HidApiUSB(Interface):
         """
         write data on the OUT endpoint associated to the HID interface
         """
-        for _ in range(64 - len(data)):
-            data.append(0)
-
-        self.device.write([0] + data)
-        return
+        report = self._report
+        report[1:1+len(data)] = data
+        report[1+len(data):] = self._zeros[len(data):]
+        self.device.write(report)
 
 
     def read(self, timeout = -1):
         """
-        read data on the IN endpoint associated to the HID interface
+        read data on the IN endpoint associated to the HID interface,
+        timeout is in milliseconds
         """
-        return self.device.read(64)
+        # hidapi blocks indefinitely with a timeout of 0
+        data = self.device.read(self.packet_size, max(timeout, 0))
+        if not data:
+            raise TimeoutError('Read from %s timed out' % self.path)
+        return data
 
     def close(self):
         """
         close the interface
         """
-        self.device.close()
+        if self.device is not None:
+            self.device.close()
+            self.device = None
 
     def setPacketCount(self, count):
         # No interface level restrictions on count
         self.packet_count = count
 
+    def setPacketSize(self, size):
+        self.packet_size = size
+        # Report number followed by the report, padded from a preallocated
+        # buffer of zeros
+        self._report = bytearray(size + 1)
+        self._zeros = bytearray(size)
+
     def __eq__(self, other):
         return self.path == other.path
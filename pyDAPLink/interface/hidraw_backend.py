@@ -0,0 +1,159 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from interface import Interface
+from hid_report import reportSizes
+from hotplug import udevHotplug
+from ..errors import TimeoutError
+import logging, os, select
+
+# Linux exposes HID devices as /dev/hidrawN, described in sysfs
+SYSFS_PATH = '/sys/class/hidraw'
+DEV_PATH = '/dev'
+
+available = os.path.isdir(SYSFS_PATH)
+
+
+def readAttribute(path, default=''):
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except IOError:
+        return default
+
+def readUevent(path):
+    """ Returns the KEY=value pairs of a sysfs uevent file """
+    uevent = {}
+    for line in readAttribute(path).splitlines():
+        key, _, value = line.partition('=')
+        uevent[key] = value
+    return uevent
+
+
+class HidrawUSB(Interface):
+    """
+    This class provides basic functions to access
+    a USB HID device through Linux hidraw nodes:
+        - write/read the device node
+    """
+    name = 'hidraw'
+    available = available
+    hotplug = staticmethod(udevHotplug)
+
+    def __init__(self):
+        super(HidrawUSB, self).__init__()
+        self.fd = None
+        self._poll = None
+        self.setPacketSize(self.packet_size)
+
+    def open(self):
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR)
+            self._poll = select.poll()
+            self._poll.register(self.fd, select.POLLIN)
+
+    @staticmethod
+    def getConnectedInterfaces(vid, pid):
+        """
+        returns all the hidraw devices which match HidrawUSB.vid/HidrawUSB.pid.
+        returns an array of HidrawUSB (Interface) objects
+        """
+        boards = []
+
+        for node in sorted(os.listdir(SYSFS_PATH)):
+            device = os.path.join(SYSFS_PATH, node, 'device')
+            uevent = readUevent(os.path.join(device, 'uevent'))
+
+            # HID_ID is bus:vendor:product in hex
+            try:
+                _, hid_vid, hid_pid = [int(field, 16) for field
+                                       in uevent['HID_ID'].split(':')]
+            except (KeyError, ValueError):
+                continue
+
+            if (hid_vid, hid_pid) != (vid, pid):
+                continue
+
+            # The USB device is the parent of the HID device's interface
+            usb_device = os.path.join(device, '..', '..')
+
+            new_board = HidrawUSB()
+            new_board.vendor_name = readAttribute(
+                    os.path.join(usb_device, 'manufacturer'))
+            new_board.product_name = readAttribute(
+                    os.path.join(usb_device, 'product'),
+                    uevent.get('HID_NAME', ''))
+            new_board.serial_number = uevent.get('HID_UNIQ') or \
+                    readAttribute(os.path.join(usb_device, 'serial'))
+            new_board.vid = vid
+            new_board.pid = pid
+            new_board.path = os.path.join(DEV_PATH, node)
+
+            try:
+                with open(os.path.join(device, 'report_descriptor'), 'rb') as file:
+                    _, size = reportSizes(file.read())
+            except IOError:
+                size = 0
+            if size:
+                new_board.setPacketSize(size)
+
+            boards.append(new_board)
+
+        if not boards:
+            logging.debug("No hidraw device connected")
+
+        return boards
+
+    def write(self, data):
+        """
+        write a report to the device node
+        """
+        report = self._report
+        report[1:1+len(data)] = data
+        report[1+len(data):] = self._zeros[len(data):]
+        os.write(self.fd, report)
+
+    def read(self, timeout = -1):
+        """
+        read a report from the device node, timeout is in milliseconds
+        """
+        if not self._poll.poll(None if timeout < 0 else timeout):
+            raise TimeoutError('Read from %s timed out' % self.path)
+
+        return bytearray(os.read(self.fd, self.packet_size))
+
+    def setPacketCount(self, count):
+        # No interface level restrictions on count
+        self.packet_count = count
+
+    def setPacketSize(self, size):
+        self.packet_size = size
+        # Report number followed by the report, unnumbered reports use 0
+        self._report = bytearray(size + 1)
+        self._zeros = bytearray(size)
+
+    def __eq__(self, other):
+        return self.path == other.path
+
+    def close(self):
+        """
+        close the interface
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self._poll = None
@@ -0,0 +1,68 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from threading import Lock
+import logging
+
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
+
+# Subsystems whose devices back the USB interfaces. hidraw nodes
+# appear after their USB device, so both are watched.
+UDEV_SUBSYSTEMS = ('usb', 'hidraw')
+
+_callbacks = []
+_observer = None
+_lock = Lock()
+
+
+def _udevEvent(action, device):
+    if action in ('add', 'remove'):
+        for callback in list(_callbacks):
+            callback()
+
+def udevHotplug(callback):
+    """
+    Calls callback whenever a USB device is added or removed.
+    Returns False if udev notifications are not available.
+    """
+    global _observer
+
+    if not pyudev:
+        return False
+
+    with _lock:
+        if not _observer:
+            try:
+                context = pyudev.Context()
+                monitor = pyudev.Monitor.from_netlink(context)
+                for subsystem in UDEV_SUBSYSTEMS:
+                    monitor.filter_by(subsystem)
+                _observer = pyudev.MonitorObserver(
+                        monitor, event_handler=_udevEvent)
+                _observer.daemon = True
+                _observer.start()
+            except Exception as e:
+                logging.debug('udev monitor unavailable: %s', e)
+                return False
+
+        _callbacks.append(callback)
+
+    return True
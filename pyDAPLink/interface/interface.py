@@ -24,7 +24,11 @@ class Interface(object):
         self.pid = 0
         self.vendor_name = ""
         self.product_name = ""
+        self.serial_number = ""
+        # Location of the device, stable while it stays plugged in
+        self.path = None
         self.packet_count = 1
+        self.packet_size = 64
         return
     
     def open(self):
@@ -42,6 +46,14 @@ class Interface(object):
                str(hex(self.vid)) + ", " + \
                str(hex(self.pid)) + ")"
     
+    @staticmethod
+    def hotplug(callback):
+        """
+        Registers a callback for when devices are added or removed.
+        Returns False if the interface can't provide notifications.
+        """
+        return False
+
     def setPacketCount(self, count):
         # Unless overridden the packet count cannot be changed
         return
@@ -49,6 +61,13 @@ class Interface(object):
     def getPacketCount(self):
         return self.packet_count
 
+    def setPacketSize(self, size):
+        # Unless overridden the packet size cannot be changed
+        return
+
+    def getPacketSize(self):
+        return self.packet_size
+
     def __eq__(self):
         return
 
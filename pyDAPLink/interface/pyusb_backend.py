@@ -16,11 +16,19 @@
 """
 
 from interface import Interface
-import logging, os, threading
+from hotplug import udevHotplug
+from ..errors import TimeoutError
+from Queue import Queue, Empty
+from collections import deque
+from ctypes import addressof, byref, c_int, c_long, c_void_p, \
+                   create_string_buffer, POINTER, Structure
+from time import time
+import logging, os, select, threading
 
 try:
     import usb.core
     import usb.util
+    import usb.backend.libusb1 as libusb1
 except:
     if os.name == "posix" and not os.uname()[0] == 'Darwin':
         logging.error("PyUSB is required on a Linux Machine")
@@ -28,36 +36,248 @@ except:
 else:
     available = True
 
+
+class PacketQueue(object):
+    """
+    Queue of received packets that can be waited on with a timeout.
+    On Python 2 Queue.get polls when given a timeout, so on posix the
+    wait is done in select on a pipe that is written once per packet.
+    """
+    def __init__(self):
+        if os.name == 'posix':
+            self._packets = deque()
+            self._rfd, self._wfd = os.pipe()
+        else:
+            self._packets = Queue()
+            self._rfd, self._wfd = None, None
+
+    def put(self, packet):
+        if self._rfd is None:
+            self._packets.put(packet)
+        else:
+            self._packets.append(packet)
+            os.write(self._wfd, '\0')
+
+    def get(self, timeout=-1):
+        """ timeout is in milliseconds, raises TimeoutError on expiry """
+        timeout = None if timeout < 0 else timeout/1000.0
+
+        if self._rfd is None:
+            try:
+                return self._packets.get(timeout=timeout)
+            except Empty:
+                raise TimeoutError('Read timed out')
+
+        if not select.select([self._rfd], [], [], timeout)[0]:
+            raise TimeoutError('Read timed out')
+        os.read(self._rfd, 1)
+        return self._packets.popleft()
+
+    def __del__(self):
+        if self._rfd is not None:
+            os.close(self._rfd)
+            os.close(self._wfd)
+
+
+def usbPath(device):
+    """ Bus and port numbers of a device, in the form used by sysfs """
+    try:
+        ports = device.port_numbers
+    except Exception:
+        ports = None
+
+    if ports:
+        return '%d-%s' % (device.bus, '.'.join(str(port) for port in ports))
+    return '%d-%d' % (device.bus, device.address)
+
+
+class EventLoop(object):
+    """
+    A single thread running handle for every open board. Boards acquire
+    the loop when opened and release it when closed, the thread only
+    runs while at least one board is open.
+    """
+    def __init__(self, handle):
+        self._handle = handle
+        self._lock = threading.Lock()
+        self._users = 0
+        self._thread = None
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users:
+                return
+            thread, self._thread = self._thread, None
+
+        # handle returns within its own timeout
+        thread.join()
+
+    def _run(self):
+        thread = threading.current_thread()
+        while self._thread is thread:
+            self._handle()
+
+
+class _Timeval(Structure):
+    _fields_ = [('tv_sec', c_long), ('tv_usec', c_long)]
+
+# Seconds the event loop waits for completions before checking if
+# it should stop
+EVENT_TIMEOUT = 0.1
+
+_loops = {}
+_loops_lock = threading.Lock()
+
+def _eventLoop(backend):
+    """ Returns the event loop of a libusb context. """
+    with _loops_lock:
+        if backend not in _loops:
+            lib = backend.lib
+            # Not declared by PyUSB
+            transfer_p = POINTER(libusb1._libusb_transfer)
+            lib.libusb_cancel_transfer.argtypes = [transfer_p]
+            lib.libusb_cancel_transfer.restype = c_int
+            lib.libusb_handle_events_timeout.argtypes = [c_void_p,
+                                                         POINTER(_Timeval)]
+            lib.libusb_handle_events_timeout.restype = c_int
+
+            timeout = _Timeval(0, int(EVENT_TIMEOUT*1000000))
+            _loops[backend] = EventLoop(
+                    lambda: lib.libusb_handle_events_timeout(backend.ctx,
+                                                              byref(timeout)))
+        return _loops[backend]
+
+
 class PyUSB(Interface):
     """
     This class provides basic functions to access
     a USB HID device using pyusb:
         - write/read an endpoint
+
+    Transfers are submitted to libusb asynchronously and completed by an
+    event loop shared by all open boards.
     """    
     name = 'pyusb'
     available = available
+    hotplug = staticmethod(udevHotplug)
 
     def __init__(self):
         super(PyUSB, self).__init__()
         self.ep_out = None
         self.ep_in = None
         self.dev = None
-        self.closed = False
-        self.rcv_data = []
-        self.read_sem = threading.Semaphore(0)
-    
-    def start_rx(self):
-        self.thread = threading.Thread(target = self.rx_task)
-        self.thread.daemon = True
-        self.thread.start()
-    
-    def rx_task(self):
-        while not self.closed:
-            self.read_sem.acquire()
-            if not self.closed:
-                # Timeouts appear to corrupt data occasionally.  Because of this the
-                # timeout is set to infinite.
-                self.rcv_data.append(self.ep_in.read(self.ep_in.wMaxPacketSize, -1))
+        self.closed = True
+        # Received packets, or exceptions to raise in read
+        self.rcv_data = None
+        # Responses expected from the device without a read submitted
+        self.reads_pending = 0
+        # Submitted reads
+        self.reads_submitted = 0
+        # Guards the transfers, which the event loop completes
+        self.read_cond = threading.Condition()
+        # Transfers in flight with their buffers, by address
+        self._transfers = {}
+        self._loop = None
+        self._callback = None
+
+    def open(self):
+        if not self.closed:
+            return
+
+        backend = self.dev._ctx.backend
+        if not isinstance(backend, libusb1._LibUSB):
+            raise IOError('PyUSB needs the libusb 1.0 backend')
+
+        self.dev._ctx.managed_claim_interface(self.dev, self.intf_number)
+        self._lib = backend.lib
+        self._handle = self.dev._ctx.handle.handle
+        # Kept for as long as transfers may call it
+        self._callback = libusb1._libusb_transfer_cb_fn_p(self._complete)
+
+        with self.read_cond:
+            # Each session gets its own queue, so a late completion
+            # can't deliver into a later session
+            self.rcv_data = PacketQueue()
+            self.reads_pending = 0
+            self.reads_submitted = 0
+            self.closed = False
+
+        self._loop = _eventLoop(backend)
+        self._loop.acquire()
+
+    def _transfer(self, ep, data):
+        """ Submits a transfer on ep, data is bytes to send or a size to read. """
+        if isinstance(data, (int, long)):
+            buffer = create_string_buffer(data)
+        else:
+            buffer = create_string_buffer(str(bytearray(data)), len(data))
+
+        transfer = self._lib.libusb_alloc_transfer(0)
+        if not transfer:
+            raise MemoryError('USB transfer not allocated')
+
+        fields = transfer.contents
+        fields.dev_handle = self._handle
+        fields.endpoint = ep.bEndpointAddress
+        fields.type = usb.util.endpoint_type(ep.bmAttributes)
+        fields.timeout = 0
+        fields.length = len(buffer)
+        fields.buffer = addressof(buffer)
+        fields.callback = self._callback
+
+        key = addressof(fields)
+        self._transfers[key] = (transfer, buffer, self.rcv_data)
+        result = self._lib.libusb_submit_transfer(transfer)
+        if result < 0:
+            del self._transfers[key]
+            self._lib.libusb_free_transfer(transfer)
+            raise usb.core.USBError('USB transfer not submitted', result)
+
+    def _fill(self):
+        """
+        Submits reads for expected responses, keeping up to packet_count
+        of them queued so the bus doesn't idle between packets.
+        """
+        while (self.reads_pending and
+               self.reads_submitted < max(self.packet_count, 1)):
+            self._transfer(self.ep_in, self.ep_in.wMaxPacketSize)
+            self.reads_pending -= 1
+            self.reads_submitted += 1
+
+    def _complete(self, transfer):
+        # Called by the event loop
+        with self.read_cond:
+            fields = transfer.contents
+            _, buffer, rcv_data = self._transfers.pop(addressof(fields))
+            status = fields.status
+            data = buffer.raw[:fields.actual_length]
+            read = fields.endpoint & 0x80
+            self._lib.libusb_free_transfer(transfer)
+
+            if rcv_data is self.rcv_data and not self.closed:
+                if status != libusb1.LIBUSB_TRANSFER_COMPLETED:
+                    rcv_data.put(usb.core.USBError(
+                            libusb1._str_transfer_error[status]))
+                elif read:
+                    rcv_data.put(bytearray(data))
+
+                if read:
+                    self.reads_submitted -= 1
+                    try:
+                        self._fill()
+                    except Exception as e:
+                        rcv_data.put(e)
+
+            self.read_cond.notify_all()
 
     @staticmethod
     def getConnectedInterfaces(vid, pid):
@@ -118,10 +338,10 @@ class PyUSB(Interface):
             new_board.intf_number = interface_number
             new_board.bus = board.bus
             new_board.address = board.address
+            new_board.path = usbPath(board)
             new_board.product_name = board.product
             new_board.vendor_name = board.manufacturer
             new_board.serial_number = board.serial_number
-            new_board.start_rx()
             boards.append(new_board)
             
         return boards
@@ -138,29 +358,34 @@ class PyUSB(Interface):
         for _ in range(report_size - len(data)):
            data.append(0)
 
-        self.read_sem.release()
-        
+        self._submit(data)
+
+    def _submit(self, data):
+        """ Sends a packet without waiting, its response is read later. """
         if not self.ep_out:
             bmRequestType = 0x21              #Host to device request of type Class of Recipient Interface
             bmRequest     = 0x09              #Set_REPORT (HID class-specific request for transferring data over EP0)
             wValue        = 0x200             #Issuing an OUT report
             wIndex        = self.intf_number  #mBed Board interface number for HID
             self.dev.ctrl_transfer(bmRequestType,bmRequest,wValue,wIndex,data)
-            return
-            #raise ValueError('EP_OUT endpoint is NULL')
-        
-        self.ep_out.write(data)
-        #logging.debug('sent: %s', data)
-        return
-        
-        
-    def read(self):
+
+        with self.read_cond:
+            if self.ep_out:
+                self._transfer(self.ep_out, data)
+            # The read is submitted before the OUT transfer completes
+            self.reads_pending += 1
+            self._fill()
+
+    def read(self, timeout = -1):
         """
-        read data on the IN endpoint associated to the HID interface
+        read data on the IN endpoint associated to the HID interface,
+        timeout is in milliseconds
         """
-        while len(self.rcv_data) == 0:
-            pass
-        return self.rcv_data.pop(0)
+        # Blocks without polling until the event loop delivers a packet
+        data = self.rcv_data.get(timeout)
+        if isinstance(data, Exception):
+            raise data
+        return data
 
     def setPacketCount(self, count):
         # No interface level restrictions on count
@@ -174,7 +399,27 @@ class PyUSB(Interface):
         close the interface
         """
         logging.debug("closing interface")
-        self.closed = True
-        self.read_sem.release()
-        self.thread.join()
-        usb.util.dispose_resources(self.dev)
+        if self.closed:
+            return
+
+        with self.read_cond:
+            self.closed = True
+            self.reads_pending = 0
+            for transfer, _, _ in self._transfers.values():
+                self._lib.libusb_cancel_transfer(transfer)
+
+            # Cancelled transfers complete through the event loop
+            deadline = time() + 1.0
+            while self._transfers and time() < deadline:
+                self.read_cond.wait(deadline - time())
+            wedged = bool(self._transfers)
+
+        self._loop.release()
+
+        # Wake up any reader still waiting on a response
+        self.rcv_data.put(IOError('Interface closed'))
+        if wedged:
+            # Transfers still refer to the device handle
+            logging.warning('USB transfers not cancelled, leaving device open')
+        else:
+            usb.util.dispose_resources(self.dev)
@@ -0,0 +1,112 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from pyusb_backend import PyUSB, usbPath, available
+import logging
+
+if available:
+    import usb.core
+    import usb.util
+
+
+def isCMSISDAPv2(device, interface):
+    """
+    CMSIS-DAP v2 probes expose a vendor specific interface
+    whose string descriptor contains "CMSIS-DAP".
+    """
+    if interface.bInterfaceClass != 0xff or not interface.iInterface:
+        return False
+
+    try:
+        name = usb.util.get_string(device, interface.iInterface)
+    except Exception:
+        return False
+
+    return name is not None and 'CMSIS-DAP' in name
+
+
+class PyUSBv2(PyUSB):
+    """
+    This class provides basic functions to access
+    a CMSIS-DAP v2 bulk interface using pyusb:
+        - write/read variable length packets
+    """
+    name = 'pyusbv2'
+    available = available
+
+    @staticmethod
+    def getConnectedInterfaces(vid, pid):
+        """
+        returns all the connected devices which matches PyUSBv2.vid/PyUSBv2.pid
+        and have a CMSIS-DAP v2 interface.
+        returns an array of PyUSBv2 (Interface) objects
+        """
+        all_devices = usb.core.find(find_all=True, idVendor=vid, idProduct=pid)
+
+        boards = []
+
+        for board in all_devices:
+            config = board.get_active_configuration()
+
+            interface = next((i for i in config
+                              if isCMSISDAPv2(board, i)), None)
+            if interface is None:
+                continue
+
+            # The first pair of bulk endpoints carries commands,
+            # an optional third endpoint carries SWO
+            ep_in, ep_out = None, None
+            for ep in interface:
+                if usb.util.endpoint_type(ep.bmAttributes) != \
+                        usb.util.ENDPOINT_TYPE_BULK:
+                    continue
+                if ep.bEndpointAddress & 0x80:
+                    ep_in = ep_in or ep
+                else:
+                    ep_out = ep_out or ep
+
+            if not ep_in or not ep_out:
+                logging.error('Endpoints not found')
+                continue
+
+            new_board = PyUSBv2()
+            new_board.ep_in = ep_in
+            new_board.ep_out = ep_out
+            new_board.dev = board
+            new_board.vid = vid
+            new_board.pid = pid
+            new_board.intf_number = interface.bInterfaceNumber
+            new_board.bus = board.bus
+            new_board.address = board.address
+            new_board.path = usbPath(board)
+            new_board.product_name = board.product
+            new_board.vendor_name = board.manufacturer
+            new_board.serial_number = board.serial_number
+            # 512 bytes on high speed probes, 64 bytes on full speed probes
+            new_board.packet_size = ep_in.wMaxPacketSize
+            boards.append(new_board)
+
+        if not boards:
+            logging.debug("No CMSIS-DAP v2 device connected")
+
+        return boards
+
+    def write(self, data):
+        """
+        write data on the bulk OUT endpoint, packets are not padded
+        """
+        self._submit(data)
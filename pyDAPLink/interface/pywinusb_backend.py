@@ -16,7 +16,9 @@
 """
 
 from interface import Interface
-import logging, os
+from ..errors import TimeoutError
+from time import time
+import logging, os, threading
 
 try:
     import pywinusb.hid as hid
@@ -42,14 +44,20 @@ class PyWinUSB(Interface):
         self.report = []
         self.rcv_data = []
         self.device = None
+        self.closed = False
+        # Signalled when a report arrives or the interface closes
+        self.read_cond = threading.Condition()
         return
     
     # handler called when a report is received
     def rx_handler(self, data):
         #logging.debug("rcv: %s", data[1:])
-        self.rcv_data.append(data[1:])
+        with self.read_cond:
+            self.rcv_data.append(data[1:])
+            self.read_cond.notify()
     
     def open(self):
+        self.closed = False
         self.device.open()
 
 	reports = self.device.find_output_reports()
@@ -105,11 +113,22 @@ class PyWinUSB(Interface):
         
     def read(self, timeout = -1):
         """
-        read data on the IN endpoint associated to the HID interface
+        read data on the IN endpoint associated to the HID interface,
+        timeout is in milliseconds
         """
-        while len(self.rcv_data) == 0:
-            pass
-        return self.rcv_data.pop(0)
+        deadline = time() + timeout/1000.0
+        with self.read_cond:
+            while len(self.rcv_data) == 0:
+                if self.closed:
+                    raise IOError('Interface closed')
+                if timeout < 0:
+                    self.read_cond.wait()
+                else:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise TimeoutError('Read from %s timed out' % self.path)
+                    self.read_cond.wait(remaining)
+            return self.rcv_data.pop(0)
 
     def setPacketCount(self, count):
         # No interface level restrictions on count
@@ -123,4 +142,7 @@ class PyWinUSB(Interface):
         close the interface
         """
         logging.debug("closing interface")
+        with self.read_cond:
+            self.closed = True
+            self.read_cond.notify_all()
         self.device.close()
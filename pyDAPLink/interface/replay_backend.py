@@ -0,0 +1,169 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from interface import Interface
+from .trace import load, TRACE_WRITE
+from collections import deque
+from time import time, sleep
+import logging, os
+
+
+# Traces to replay, one board per trace. These can be set with
+# ReplayUSB.configure or with the PYDAPLINK_REPLAY environment variable
+# as a list of paths, and PYDAPLINK_REPLAY_TIMING to replay the
+# recorded round trip latencies.
+OPTIONS = {'traces': [path for path in
+                      os.environ.get('PYDAPLINK_REPLAY', '').split(os.pathsep)
+                      if path],
+           'timing': os.environ.get('PYDAPLINK_REPLAY_TIMING', '0') != '0',
+           'strict': True,
+           }
+
+
+def exchanges(records):
+    """
+    Pairs recorded writes with the responses read back, returns a list
+    of (write, response, latency) tuples and the packet count needed.
+    """
+    pending = deque()
+    pairs = []
+    packet_count = 1
+
+    for timestamp, direction, length, data in records:
+        if direction == TRACE_WRITE:
+            pending.append((timestamp, data))
+            packet_count = max(packet_count, len(pending))
+        elif pending:
+            # Reads recorded before the first write have lost their command
+            sent, cmd = pending.popleft()
+            pairs.append((cmd, data, timestamp - sent))
+
+    # Commands whose responses were never read
+    pairs.extend((cmd, None, 0.0) for _, cmd in pending)
+
+    return pairs, packet_count
+
+
+class ReplayUSB(Interface):
+    """
+    This class replays traces recorded by TraceRecorder, serving the
+    recorded responses to the same sequence of commands.
+    """
+    name = 'replay'
+    available = True
+
+    # Called when configure changes the traces
+    callbacks = []
+
+    def __init__(self):
+        super(ReplayUSB, self).__init__()
+        self.packet_size = 64
+        self._exchanges = []
+        self._index = 0
+        self._pending = deque()
+
+    @staticmethod
+    def configure(**options):
+        OPTIONS.update(options)
+
+        for callback in ReplayUSB.callbacks:
+            callback()
+
+    @staticmethod
+    def hotplug(callback):
+        ReplayUSB.callbacks.append(callback)
+        return True
+
+    @staticmethod
+    def getConnectedInterfaces(vid, pid):
+        """
+        returns an interface for each configured trace, traces
+        do not record vid/pid so every vid/pid matches.
+        returns an array of ReplayUSB (Interface) objects
+        """
+        boards = []
+
+        for path in OPTIONS['traces']:
+            new_board = ReplayUSB()
+            new_board.vendor_name = 'Replay'
+            new_board.product_name = os.path.basename(path)
+            new_board.serial_number = os.path.splitext(
+                    os.path.basename(path))[0]
+            new_board.vid = vid
+            new_board.pid = pid
+            new_board.path = path
+            boards.append(new_board)
+
+        if not boards:
+            logging.debug("No traces to replay")
+
+        return boards
+
+    def open(self):
+        self.packet_size, records = load(self.path)
+        self._exchanges, self.packet_count = exchanges(records)
+        self._index = 0
+        self._pending.clear()
+
+    def write(self, data):
+        """
+        check data against the recorded command, the recorded
+        response becomes available to read
+        """
+        if self._index >= len(self._exchanges):
+            raise IOError('Replay of %s finished' % self.path)
+
+        cmd, resp, latency = self._exchanges[self._index]
+        if OPTIONS['strict'] and list(cmd) != list(data[:self.packet_size]):
+            raise IOError('Replay of %s diverged at command %d' %
+                          (self.path, self._index))
+        self._index += 1
+
+        ready = time()
+        if OPTIONS['timing']:
+            if self._pending:
+                ready = max(ready, self._pending[-1][0])
+            ready += latency
+
+        self._pending.append((ready, resp))
+
+    def read(self, timeout = -1):
+        """
+        read the recorded response of the oldest pending command
+        """
+        if not self._pending:
+            raise IOError('No response pending')
+
+        ready, resp = self._pending.popleft()
+        if resp is None:
+            raise IOError('Replay of %s has no response recorded' % self.path)
+
+        delay = ready - time()
+        if delay > 0:
+            sleep(delay)
+
+        return list(resp) + [0]*(self.packet_size - len(resp))
+
+    def setPacketCount(self, count):
+        # The recorded traffic determines the packet count
+        return
+
+    def __eq__(self, other):
+        return self.path == getattr(other, 'path', None)
+
+    def close(self):
+        self._pending.clear()
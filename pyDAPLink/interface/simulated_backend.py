@@ -0,0 +1,504 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from interface import Interface
+from ..errors import TimeoutError
+from collections import deque
+from threading import Lock
+from time import time, sleep
+import logging, os, random
+
+
+# Default options of the simulated probes. These can be overridden with
+# SimulatedUSB.configure or with a comma separated list of key=value pairs
+# in the PYDAPLINK_SIMULATED environment variable, which is inherited by
+# servers started from a client.
+OPTIONS = {'boards': 1,             # Number of simulated probes
+           'vid': 0x0d28,
+           'pid': 0x0204,
+           'latency': 0.0,          # Seconds spent per packet by the probe
+           'packet_size': 64,
+           'packet_count': 4,
+           'fault': 0.0,            # Probability of an AP access faulting
+           'stall': 0.0,            # Probability of a response being lost
+           'seed': 0,
+           }
+
+def _parse_options(string):
+    options = {}
+    for option in string.split(','):
+        if option:
+            key, value = option.split('=', 1)
+            if isinstance(OPTIONS[key], float):
+                options[key] = float(value)
+            else:
+                options[key] = int(value, 0)
+    return options
+
+OPTIONS.update(_parse_options(os.environ.get('PYDAPLINK_SIMULATED', '')))
+
+
+# Command ids
+DAP_INFO = 0x00
+DAP_LED = 0x01
+DAP_CONNECT = 0x02
+DAP_DISCONNECT = 0x03
+DAP_TRANSFER_CONFIGURE = 0x04
+DAP_TRANSFER = 0x05
+DAP_TRANSFER_BLOCK = 0x06
+DAP_WRITE_ABORT = 0x08
+DAP_DELAY = 0x09
+DAP_RESET_TARGET = 0x0a
+DAP_SWJ_PINS = 0x10
+DAP_SWJ_CLOCK = 0x11
+DAP_SWJ_SEQUENCE = 0x12
+DAP_SWD_CONFIGURE = 0x13
+DAP_VENDOR0 = 0x80
+DAP_INVALID = 0xff
+
+DAP_OK = 0x00
+DAP_ERROR = 0xff
+
+# Transfer request bits
+AP_ACC = 1 << 0
+READ = 1 << 1
+VALUE_MATCH = 1 << 4
+MATCH_MASK = 1 << 5
+
+# Transfer responses
+TRANSFER_OK = 0x01
+TRANSFER_FAULT = 0x04
+TRANSFER_MISMATCH = 0x10
+
+# DP registers and bits
+DP_IDCODE_VALUE = 0x2ba01477
+CTRLSTAT_STICKYORUN = 0x00000002
+CTRLSTAT_STICKYCMP = 0x00000010
+CTRLSTAT_STICKYERR = 0x00000020
+CTRLSTAT_WDATAERR = 0x00000080
+CTRLSTAT_STICKY = (CTRLSTAT_STICKYORUN | CTRLSTAT_STICKYCMP |
+                   CTRLSTAT_STICKYERR | CTRLSTAT_WDATAERR)
+CTRLSTAT_CDBGPWRUPREQ = 0x10000000
+CTRLSTAT_CSYSPWRUPREQ = 0x40000000
+ABORT_STKCMPCLR = 0x02
+ABORT_STKERRCLR = 0x04
+ABORT_WDERRCLR = 0x08
+ABORT_ORUNERRCLR = 0x10
+
+# MEM-AP registers
+AP_CSW = 0x00
+AP_TAR = 0x04
+AP_DRW = 0x0c
+AP_BASE = 0xf8
+AP_IDR = 0xfc
+AP_IDR_VALUE = 0x24770011
+AP_BASE_VALUE = 0xe00ff003
+CSW_RESET = 0x03000040
+
+SIZE_BYTES = {0: 1, 1: 2, 2: 4}
+SIZE_MASK = {1: 0xff, 2: 0xffff, 4: 0xffffffff}
+
+
+def _word(data, offset):
+    return (data[offset] |
+            (data[offset+1] << 8) |
+            (data[offset+2] << 16) |
+            (data[offset+3] << 24))
+
+def _bytes(word):
+    return [word & 0xff, (word >> 8) & 0xff,
+            (word >> 16) & 0xff, (word >> 24) & 0xff]
+
+
+class SimulatedProbe(object):
+    """
+    Software model of a CMSIS-DAP probe connected over SWD to a target
+    with a single MEM-AP. Memory is a sparse map of words that reads as
+    zero until written.
+    """
+    def __init__(self, serial, options):
+        self.serial = serial
+        self.options = options
+        self.memory = {}
+        self._random = random.Random(options['seed'])
+
+        self.connected = False
+        self.match_retry = 0
+        self.match_mask = 0xffffffff
+        self.pins = 0xff
+
+        self.ctrl_stat = 0
+        self.select = 0
+        self.rdbuff = 0
+        self.csw = CSW_RESET
+        self.tar = 0
+
+        self._commands = {
+            DAP_INFO: self._info,
+            DAP_LED: self._status,
+            DAP_CONNECT: self._connect,
+            DAP_DISCONNECT: self._disconnect,
+            DAP_TRANSFER_CONFIGURE: self._transfer_configure,
+            DAP_TRANSFER: self._transfer,
+            DAP_TRANSFER_BLOCK: self._transfer_block,
+            DAP_WRITE_ABORT: self._write_abort,
+            DAP_DELAY: self._status,
+            DAP_RESET_TARGET: self._reset_target,
+            DAP_SWJ_PINS: self._swj_pins,
+            DAP_SWJ_CLOCK: self._status,
+            DAP_SWJ_SEQUENCE: self._status,
+            DAP_SWD_CONFIGURE: self._status,
+        }
+
+    def command(self, cmd):
+        """ Executes a command packet and returns the response packet. """
+        if cmd[0] in self._commands:
+            resp = self._commands[cmd[0]](cmd)
+        elif cmd[0] >= DAP_VENDOR0 and cmd[0] < DAP_INVALID:
+            resp = [cmd[0]]
+        else:
+            resp = [DAP_INVALID]
+
+        return resp + [0]*(self.options['packet_size'] - len(resp))
+
+    # Memory access
+    def readMem(self, addr, size=4):
+        word = self.memory.get(addr & ~3, 0)
+        shift = (addr & 3) << 3
+        return (word >> shift) & SIZE_MASK[size]
+
+    def writeMem(self, addr, data, size=4):
+        shift = (addr & 3) << 3
+        mask = SIZE_MASK[size] << shift
+        word = self.memory.get(addr & ~3, 0)
+        self.memory[addr & ~3] = (word & ~mask) | ((data << shift) & mask)
+
+    # Register access, returns ack and read value
+    def _access(self, request, data=0):
+        addr = request & 0x0c
+
+        if not request & AP_ACC:
+            if request & READ:
+                if addr == 0x00:
+                    return TRANSFER_OK, DP_IDCODE_VALUE
+                elif addr == 0x04:
+                    return TRANSFER_OK, self.ctrl_stat
+                else:
+                    return TRANSFER_OK, self.rdbuff
+            else:
+                if addr == 0x00:
+                    self._abort(data)
+                elif addr == 0x04:
+                    # Power up requests are acknowledged immediately
+                    acks = (data & (CTRLSTAT_CDBGPWRUPREQ |
+                                    CTRLSTAT_CSYSPWRUPREQ)) << 1
+                    self.ctrl_stat = ((data & ~CTRLSTAT_STICKY) | acks |
+                                      (self.ctrl_stat & CTRLSTAT_STICKY))
+                elif addr == 0x08:
+                    self.select = data
+                return TRANSFER_OK, 0
+
+        if self.ctrl_stat & CTRLSTAT_STICKYERR:
+            return TRANSFER_FAULT, 0
+
+        if (self.options['fault'] and
+            self._random.random() < self.options['fault']):
+            self.ctrl_stat |= CTRLSTAT_STICKYERR
+            return TRANSFER_FAULT, 0
+
+        # Only AP 0 exists
+        if self.select & 0xff000000:
+            return TRANSFER_OK, 0
+
+        addr |= self.select & 0xf0
+        value = 0
+
+        if addr == AP_CSW:
+            if request & READ:
+                value = self.csw
+            else:
+                self.csw = data
+        elif addr == AP_TAR:
+            if request & READ:
+                value = self.tar
+            else:
+                self.tar = data & 0xffffffff
+        elif addr == AP_DRW:
+            size = SIZE_BYTES.get(self.csw & 0x7, 4)
+            if request & READ:
+                value = self.memory.get(self.tar & ~3, 0)
+            else:
+                self.writeMem(self.tar, data >> ((self.tar & 3) << 3), size)
+            if self.csw & 0x30 == 0x10:
+                self.tar = (self.tar + size) & 0xffffffff
+        elif addr in (0x10, 0x14, 0x18, 0x1c):
+            bd = (self.tar & ~0xf) | (addr & 0xc)
+            if request & READ:
+                value = self.memory.get(bd, 0)
+            else:
+                self.memory[bd] = data
+        elif addr == AP_BASE and request & READ:
+            value = AP_BASE_VALUE
+        elif addr == AP_IDR and request & READ:
+            value = AP_IDR_VALUE
+
+        self.rdbuff = value
+        return TRANSFER_OK, value
+
+    def _abort(self, data):
+        if data & ABORT_STKCMPCLR:
+            self.ctrl_stat &= ~CTRLSTAT_STICKYCMP
+        if data & ABORT_STKERRCLR:
+            self.ctrl_stat &= ~CTRLSTAT_STICKYERR
+        if data & ABORT_WDERRCLR:
+            self.ctrl_stat &= ~CTRLSTAT_WDATAERR
+        if data & ABORT_ORUNERRCLR:
+            self.ctrl_stat &= ~CTRLSTAT_STICKYORUN
+
+    # Commands
+    def _status(self, cmd):
+        return [cmd[0], DAP_OK]
+
+    def _info(self, cmd):
+        options = self.options
+        strings = {0x01: 'ARM', 0x02: 'Simulated CMSIS-DAP',
+                   0x03: self.serial, 0x04: '1.0'}
+
+        if cmd[1] in strings:
+            string = [ord(c) for c in strings[cmd[1]]]
+            return [cmd[0], len(string)] + string
+        elif cmd[1] == 0xf0:
+            # SWD only
+            return [cmd[0], 1, 0x01]
+        elif cmd[1] == 0xfe:
+            return [cmd[0], 1, options['packet_count']]
+        elif cmd[1] == 0xff:
+            return [cmd[0], 2, options['packet_size'] & 0xff,
+                               options['packet_size'] >> 8]
+        else:
+            return [cmd[0], 0]
+
+    def _connect(self, cmd):
+        # Only SWD is supported
+        if cmd[1] in (0, 1):
+            self.connected = True
+            return [cmd[0], 1]
+        return [cmd[0], 0]
+
+    def _disconnect(self, cmd):
+        self.connected = False
+        return [cmd[0], DAP_OK]
+
+    def _transfer_configure(self, cmd):
+        self.match_retry = cmd[4] | (cmd[5] << 8)
+        return [cmd[0], DAP_OK]
+
+    def _write_abort(self, cmd):
+        self._abort(_word(cmd, 2))
+        return [cmd[0], DAP_OK]
+
+    def _reset_target(self, cmd):
+        return [cmd[0], DAP_OK, 0]
+
+    def _swj_pins(self, cmd):
+        self.pins = (self.pins & ~cmd[2]) | (cmd[1] & cmd[2])
+        return [cmd[0], self.pins]
+
+    def _transfer(self, cmd):
+        count = cmd[2]
+        offset = 3
+        data = []
+        ack = TRANSFER_OK
+
+        for executed in xrange(count):
+            request = cmd[offset]
+            offset += 1
+
+            if request & READ and request & VALUE_MATCH:
+                match = _word(cmd, offset)
+                offset += 4
+
+                # Retries happen on the probe
+                for _ in xrange(self.match_retry + 1):
+                    ack, value = self._access(request)
+                    if ack != TRANSFER_OK or value & self.match_mask == match:
+                        break
+                else:
+                    ack |= TRANSFER_MISMATCH
+            elif request & READ:
+                ack, value = self._access(request)
+                if ack == TRANSFER_OK:
+                    data.extend(_bytes(value))
+            elif request & MATCH_MASK:
+                self.match_mask = _word(cmd, offset)
+                offset += 4
+            else:
+                ack, _ = self._access(request, _word(cmd, offset))
+                offset += 4
+
+            if ack != TRANSFER_OK:
+                return [cmd[0], executed, ack] + data
+        else:
+            return [cmd[0], count, ack] + data
+
+    def _transfer_block(self, cmd):
+        count = cmd[2] | (cmd[3] << 8)
+        request = cmd[4]
+        offset = 5
+        data = []
+        ack = TRANSFER_OK
+
+        for executed in xrange(count):
+            if request & READ:
+                ack, value = self._access(request)
+                if ack == TRANSFER_OK:
+                    data.extend(_bytes(value))
+            else:
+                ack, _ = self._access(request, _word(cmd, offset))
+                offset += 4
+
+            if ack != TRANSFER_OK:
+                return [cmd[0], executed & 0xff, executed >> 8, ack] + data
+        else:
+            return [cmd[0], count & 0xff, count >> 8, ack] + data
+
+
+class SimulatedUSB(Interface):
+    """
+    This class emulates a CMSIS-DAP probe in software, for
+    testing and benchmarking without hardware.
+    """
+    name = 'simulated'
+    available = True
+
+    # Probe models persist for the lifetime of the process
+    probes = {}
+    lock = Lock()
+    # Called when configure replaces the probes
+    callbacks = []
+
+    def __init__(self):
+        super(SimulatedUSB, self).__init__()
+        self.probe = None
+        self.latency = 0.0
+        self._pending = deque()
+
+    @staticmethod
+    def configure(**options):
+        """
+        Changes the options of the simulated probes, existing probes
+        are replaced by probes with the new options.
+        """
+        with SimulatedUSB.lock:
+            OPTIONS.update(options)
+            SimulatedUSB.probes.clear()
+
+        for callback in SimulatedUSB.callbacks:
+            callback()
+
+    @staticmethod
+    def hotplug(callback):
+        SimulatedUSB.callbacks.append(callback)
+        return True
+
+    @staticmethod
+    def getConnectedInterfaces(vid, pid):
+        """
+        returns all the simulated probes which match vid/pid.
+        returns an array of SimulatedUSB (Interface) objects
+        """
+        with SimulatedUSB.lock:
+            if (vid, pid) != (OPTIONS['vid'], OPTIONS['pid']):
+                logging.debug("No simulated device matches")
+                return []
+
+            options = OPTIONS.copy()
+            boards = []
+
+            for i in xrange(options['boards']):
+                serial = 'SIM%04d' % i
+                if serial not in SimulatedUSB.probes:
+                    SimulatedUSB.probes[serial] = SimulatedProbe(serial, options)
+
+                new_board = SimulatedUSB()
+                new_board.probe = SimulatedUSB.probes[serial]
+                new_board.vendor_name = 'ARM'
+                new_board.product_name = 'Simulated CMSIS-DAP'
+                new_board.serial_number = serial
+                new_board.vid = vid
+                new_board.pid = pid
+                new_board.latency = options['latency']
+                new_board.packet_count = options['packet_count']
+                new_board.packet_size = options['packet_size']
+                boards.append(new_board)
+
+            return boards
+
+    def open(self):
+        self._pending.clear()
+
+    def write(self, data):
+        """
+        execute a command, the response becomes available
+        after the probe's latency
+        """
+        if len(data) > self.probe.options['packet_size']:
+            raise IOError('Packet exceeds packet size')
+
+        # The probe handles packets one at a time
+        start = time()
+        if self._pending:
+            start = max(start, self._pending[-1][0])
+
+        resp = self.probe.command(data)
+        if (self.probe.options['stall'] and
+            self.probe._random.random() < self.probe.options['stall']):
+            resp = None
+
+        self._pending.append((start + self.latency, resp))
+
+    def read(self, timeout = -1):
+        """
+        read the response of the oldest pending command,
+        timeout is in milliseconds
+        """
+        if not self._pending:
+            raise IOError('No response pending')
+
+        ready, resp = self._pending.popleft()
+        if resp is None:
+            # A lost response is only noticed once the deadline passes
+            if timeout < 0:
+                raise IOError('Simulated probe stalled without a timeout')
+            sleep(timeout/1000.0)
+            raise TimeoutError('Read from %s timed out' % self.serial_number)
+
+        delay = ready - time()
+        if delay > 0:
+            sleep(delay)
+
+        return resp
+
+    def setPacketCount(self, count):
+        # No interface level restrictions on count
+        self.packet_count = count
+
+    def __eq__(self, other):
+        return self.serial_number == other.serial_number
+
+    def close(self):
+        self._pending.clear()
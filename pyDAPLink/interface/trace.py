@@ -0,0 +1,130 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from time import time
+import struct
+
+
+# Trace files start with a header followed by records in
+# chronological order. Each record holds up to packet_size bytes of
+# the packet, length is the packet's original length.
+TRACE_MAGIC = 'DAPTRACE'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<8sHH')
+TRACE_RECORD = struct.Struct('<dBH')
+
+# Record directions
+TRACE_WRITE = 0
+TRACE_READ = 1
+
+
+class TraceRecorder(object):
+    """
+    Records timestamped raw packets in a preallocated ring buffer.
+    Once the buffer is full the oldest packets are overwritten.
+    """
+    def __init__(self, capacity=4096, packet_size=64):
+        self.capacity = capacity
+        self.packet_size = packet_size
+        self._slot_size = TRACE_RECORD.size + packet_size
+        self._buffer = bytearray(capacity * self._slot_size)
+        self._index = 0
+        self._count = 0
+
+    def record(self, direction, data):
+        offset = self._index * self._slot_size
+        size = min(len(data), self.packet_size)
+
+        TRACE_RECORD.pack_into(self._buffer, offset,
+                               time(), direction, len(data))
+        offset += TRACE_RECORD.size
+        self._buffer[offset:offset+size] = data[:size]
+
+        self._index = (self._index + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def clear(self):
+        self._index = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def dump(self, path):
+        """ Writes the recorded packets to a trace file. """
+        start = (self._index - self._count) % self.capacity
+
+        with open(path, 'wb') as file:
+            file.write(TRACE_HEADER.pack(
+                    TRACE_MAGIC, TRACE_VERSION, self.packet_size))
+
+            for i in xrange(self._count):
+                offset = ((start + i) % self.capacity) * self._slot_size
+                _, _, length = TRACE_RECORD.unpack_from(self._buffer, offset)
+                size = TRACE_RECORD.size + min(length, self.packet_size)
+                file.write(self._buffer[offset:offset+size])
+
+
+def load(path):
+    """
+    Reads a trace file.
+    Returns the packet size and a list of
+    (timestamp, direction, length, data) records.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    magic, version, packet_size = TRACE_HEADER.unpack_from(data, 0)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError('%s is not a supported trace file' % path)
+
+    records = []
+    offset = TRACE_HEADER.size
+
+    while offset < len(data):
+        timestamp, direction, length = TRACE_RECORD.unpack_from(data, offset)
+        offset += TRACE_RECORD.size
+        size = min(length, packet_size)
+        records.append((timestamp, direction, length,
+                        bytearray(data[offset:offset+size])))
+        offset += size
+
+    return packet_size, records
+
+
+class TraceInterface(object):
+    """
+    Wraps an interface to record the packets passing through it.
+    Everything other than write/read is passed to the underlying interface.
+    """
+    def __init__(self, interface, recorder):
+        self._interface = interface
+        self.recorder = recorder
+
+    def write(self, data):
+        # Recorded before writing since backends pad the data in place
+        self.recorder.record(TRACE_WRITE, data)
+        self._interface.write(data)
+
+    def read(self, *args, **kwargs):
+        data = self._interface.read(*args, **kwargs)
+        self.recorder.record(TRACE_READ, data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._interface, name)
@@ -0,0 +1,131 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from threading import Lock
+import json
+import logging
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Shared by servers on the same host, next to the default unix socket
+DEFAULT_INDEX = os.path.join(tempfile.gettempdir(), 'pydaplink', 'ids.json')
+
+
+class BoardIndex(object):
+    """
+    Board ids persisted to a file, so boards keep their ids when the
+    server restarts. Boards are identified by serial number and path.
+    Servers sharing the file merge their assignments when saving.
+    """
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = path
+        self._lock = Lock()
+        self._boards = self._load()
+        # Assignments not yet saved
+        self._assigned = []
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (IOError, ValueError) as e:
+            logging.debug('board index %s not loaded: %s', self.path, e)
+            return {}
+
+    @staticmethod
+    def _assign(boards, key, entry):
+        # Boards are identified by serial number, or by path without one
+        def replaced(e):
+            return (e['id'] == entry['id'] or
+                    (entry['serial'] and e['serial'] == entry['serial']) or
+                    (not entry['serial'] and not e['serial'] and
+                     e['path'] == entry['path']))
+
+        boards[key] = [e for e in boards.get(key, []) if not replaced(e)]
+        boards[key].append(entry)
+
+    def _entries(self, vid, pid):
+        return self._boards.get('%04x:%04x' % (vid, pid), [])
+
+    def ids(self, vid, pid):
+        """ Returns the ids recorded for the vid/pid. """
+        with self._lock:
+            return set(entry['id'] for entry in self._entries(vid, pid))
+
+    def lookup(self, vid, pid, serial, path):
+        """
+        Returns the id recorded for a board, matching the serial number
+        and path, then only the serial number, then only the path of
+        boards without serial numbers. Returns None if there is no match.
+        """
+        with self._lock:
+            entries = self._entries(vid, pid)
+            for match in (
+                    lambda e: (e['serial'], e['path']) == (serial, path),
+                    lambda e: serial and e['serial'] == serial,
+                    lambda e: not serial and not e['serial'] and
+                              path and e['path'] == path):
+                for entry in entries:
+                    if match(entry):
+                        return entry['id']
+
+    def assign(self, vid, pid, serial, path, id):
+        """
+        Records a board's id, replacing any board with the same id and
+        any id the board had before.
+        """
+        with self._lock:
+            key = '%04x:%04x' % (vid, pid)
+            entry = {'id': id, 'serial': serial, 'path': path}
+            self._assign(self._boards, key, entry)
+            self._assigned.append((key, entry))
+
+    def save(self):
+        """
+        Writes the index, replacing the file atomically. Assignments are
+        merged into the file as other servers left it, under a lock.
+        """
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            try:
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+
+                # The index is replaced on save, so a separate file is locked
+                with open(self.path + '.lock', 'a') as lock:
+                    if fcntl:
+                        fcntl.flock(lock, fcntl.LOCK_EX)
+
+                    boards = self._load()
+                    for key, entry in self._assigned:
+                        self._assign(boards, key, entry)
+
+                    fd, temp = tempfile.mkstemp(dir=directory or None)
+                    with os.fdopen(fd, 'w') as file:
+                        json.dump(boards, file, indent=2, sort_keys=True)
+                    os.rename(temp, self.path)
+
+                self._boards = boards
+                self._assigned = []
+            except (IOError, OSError) as e:
+                logging.warning('board index %s not saved: %s', self.path, e)
@@ -0,0 +1,76 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from ..utility import UniqueType
+from threading import Lock
+from time import time
+import logging
+
+
+# Seconds before a scan of connected devices is repeated. Without
+# hotplug notifications this bounds how stale the registry can be,
+# with them it only guards against missed notifications.
+REFRESH_INTERVAL = 1.0
+HOTPLUG_REFRESH_INTERVAL = 60.0
+
+
+class DeviceRegistry(object):
+    """
+    The connected devices of an interface backend, rescanned only after
+    hotplug notifications or once the refresh interval passes.
+    """
+    __metaclass__ = UniqueType
+
+    def __init__(self, interface):
+        self.interface = interface
+        self._lock = Lock()
+        # Maps vid/pid to the time of the scan and the interfaces found
+        self._devices = {}
+        # Incremented on every change, scans that overlap a change
+        # are not cached
+        self._generation = 0
+
+        if interface.hotplug(self.invalidate):
+            self.interval = HOTPLUG_REFRESH_INTERVAL
+        else:
+            self.interval = REFRESH_INTERVAL
+
+    def invalidate(self):
+        """ Forgets the scanned devices, the next lookup rescans. """
+        self._generation += 1
+        self._devices = {}
+        logging.debug('%s devices changed', self.interface.name)
+
+    def interfaces(self, vid, pid):
+        """ Returns the connected interfaces which match vid/pid. """
+        entry = self._devices.get((vid, pid))
+        if entry and time() - entry[0] < self.interval:
+            return entry[1]
+
+        with self._lock:
+            entry = self._devices.get((vid, pid))
+            if entry and time() - entry[0] < self.interval:
+                return entry[1]
+
+            generation = self._generation
+            scanned = time()
+            interfaces = self.interface.getConnectedInterfaces(vid, pid) or []
+
+            if generation == self._generation:
+                self._devices[(vid, pid)] = (scanned, interfaces)
+
+            return interfaces
@@ -17,13 +17,19 @@
 
 from ..utility import UniqueType
 from ..interface import default_interface
+from .registry import DeviceRegistry
 import logging
 import threading
 from threading import Lock
 
 
 class IfSelection(object):
-    """ A globally unique selection of interfaces based of vid/pid pair """
+    """
+    A globally unique selection of interfaces based of vid/pid pair.
+
+    Interfaces are kept in an immutable snapshot that enumerate replaces,
+    so lookups never wait on enumeration's USB I/O.
+    """
     __metaclass__ = UniqueType
 
     def __init__(self, vid, pid):
@@ -31,36 +37,75 @@ class IfSelection(object):
         self.pid = pid
         self._lock = Lock()
         self._ifs = {}
-        self._daplinks = {}
+        # Enumerations in progress per interface backend
+        self._enumerations = {}
         self._owners = {}
 
-    def enumerate(self, interface=default_interface):
+    def enumerate(self, interface=default_interface, index=None):
+        """
+        Adds newly connected interfaces. If index is a BoardIndex, boards
+        get the ids recorded there and new ids are recorded.
+        """
         with self._lock:
-            # Find and store all intefaces that match the vid/pid
-            # in the cache for the lifetime of this selection.
-            # We need to make sure no existing interface's ids change
-            new_ifs = interface.getConnectedInterfaces(self.vid, self.pid)
-
-            for new_if in new_ifs or []:
-                if new_if not in self._ifs.values():
-                    new_id = next(id for id in xrange(1, 2**16)
-                                  if id not in self._ifs)
-
-                    self._ifs[new_id] = new_if
+            done = self._enumerations.get(interface)
+            leader = done is None
+            if leader:
+                done = self._enumerations[interface] = threading.Event()
+
+        # Concurrent enumerations wait for the one in progress
+        if not leader:
+            done.wait()
+            return
+
+        try:
+            new_ifs = DeviceRegistry(interface).interfaces(self.vid, self.pid)
+
+            with self._lock:
+                # Find and store all intefaces that match the vid/pid
+                # in the cache for the lifetime of this selection.
+                # We need to make sure no existing interface's ids change
+                ifs = dict(self._ifs)
+                # Ids recorded for other boards are kept free for them
+                reserved = index.ids(self.vid, self.pid) if index else set()
+                added = False
+
+                for new_if in new_ifs:
+                    if new_if not in ifs.values():
+                        new_id = None
+                        if index:
+                            new_id = index.lookup(self.vid, self.pid,
+                                    new_if.serial_number, new_if.path)
+                        if new_id is None or new_id in ifs:
+                            new_id = next(id for id in xrange(1, 2**16)
+                                          if id not in ifs and
+                                             id not in reserved)
+
+                        ifs[new_id] = new_if
+                        added = True
+
+                        if index:
+                            index.assign(self.vid, self.pid,
+                                    new_if.serial_number, new_if.path, new_id)
+
+                self._ifs = ifs
+
+            if index and added:
+                index.save()
+        finally:
+            with self._lock:
+                del self._enumerations[interface]
+            done.set()
 
     def ids(self):
-        with self._lock:
-            return self._ifs.keys()
+        return self._ifs.keys()
 
     def __getitem__(self, id):
-        with self._lock:
-            return self._ifs[id]
+        return self._ifs[id]
 
     def select(self, id):
-        with self._lock:
-            if id not in self._ifs:
-                raise KeyError(id)
+        interface = self._ifs[id]
 
+        with self._lock:
             if id in self._owners and self._owners[id].is_alive():
                 return None
 
@@ -69,7 +114,12 @@ class IfSelection(object):
                           id)
 
             self._owners[id] = threading.current_thread()
-            return self._ifs[id]
+            return interface
+
+    def busy(self, id):
+        """ Returns true if a live owner has selected the board. """
+        owner = self._owners.get(id)
+        return owner is not None and owner.is_alive()
 
     def deselect(self, id):
         with self._lock:
@@ -16,6 +16,9 @@
 """
 
 from .transport import DAPLinkServerTransport
+from .stats import ServerStats, StatsExposition
+from .index import BoardIndex
+from .sessions import SessionPool
 from ..utility import encode, decode
 from ..errors import CommandError
 from ..interface import INTERFACE, default_interface
@@ -33,7 +36,10 @@ class DAPLinkServer(object):
     based server. Communication is performed by sending commands
     formed as JSON dictionaries.
     """
-    def __init__(self, address=None, socket=None, interface=None):
+    def __init__(self, address=None, socket=None, interface=None,
+                       stats_address=None, trace=None, trace_capacity=4096,
+                       index=None, session_idle=0, workers=False,
+                       profile=None):
         if interface:
             self._interface = INTERFACE[interface]
         else:
@@ -46,18 +52,42 @@ class DAPLinkServer(object):
         else:
             socket = default_socket
 
+        options = {}
+        if profile:
+            if profile not in socket.profiles:
+                raise ValueError('No %s profile for %s sockets' %
+                                 (profile, socket.name))
+            options['profile'] = profile
+
         if address:
-            self._server = socket.Server(address)
+            self._server = socket.Server(address, **options)
         else:
-            self._server = socket.Server()
+            self._server = socket.Server(**options)
 
         self.interface = self._interface.name
         self.socket = socket.name
         self._threads = set()
 
+        self._trace = trace
+        self._trace_capacity = trace_capacity
+        # Board ids are only persisted if an index file is given
+        self._index = BoardIndex(index) if index else None
+        # Released DAPLink connections are kept for session_idle seconds
+        self._sessions = SessionPool(session_idle) if session_idle else None
+        # Boards run in their own processes to use more than one core
+        self._workers = workers
+        self.stats = ServerStats()
+        if stats_address:
+            self._exposition = StatsExposition(self.stats, stats_address)
+        else:
+            self._exposition = None
+
     def init(self):
         self._server.open()
 
+        if self._exposition:
+            self._exposition.open()
+
         thread = Thread(target=self._server_task)
         thread.daemon = True
         thread.shutdown = self._server.shutdown
@@ -89,7 +119,10 @@ class DAPLinkServer(object):
             self._threads.discard(threading.current_thread())
 
     def _client_task(self, client):
-        connection = DAPLinkServerTransport(self._interface)
+        connection = DAPLinkServerTransport(self._interface, self.stats,
+                                            self._trace, self._trace_capacity,
+                                            self._index, self._sessions,
+                                            self._workers)
         connection.init()
 
         try:
@@ -100,7 +133,8 @@ class DAPLinkServer(object):
                         if not client.isalive():
                             break
 
-                        data = decode(data)
+                        data = decode(data,
+                                      connection.threshold is not None)
                     except:
                         raise CommandError('Malformed command')
 
@@ -112,13 +146,14 @@ class DAPLinkServer(object):
                     logging.error('%s: %s' % (type, message))
 
                     try:
-                        client.send(encode({'error': type, 'message': message}))
+                        client.send(encode({'error': type, 'message': message},
+                                           connection.threshold))
                     except:
                         break
                     else:
                         continue
 
-                client.send(encode(resp))
+                client.send(encode(resp, connection.threshold))
         finally:
             connection.uninit()
             client.close()
@@ -132,5 +167,11 @@ class DAPLinkServer(object):
         for thread in threads:
             thread.join()
 
+        if self._sessions:
+            self._sessions.close()
+
+        if self._exposition:
+            self._exposition.close()
+
         self._server.close()
 
@@ -0,0 +1,111 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from threading import Lock, Timer
+import logging
+
+
+class Session(object):
+    """ An initialized DAPLink connection and the settings it was made with. """
+    __slots__ = ('dap', 'settings', 'trace', 'timer')
+
+    def __init__(self, dap, settings, trace=None):
+        self.dap = dap
+        self.settings = settings
+        self.trace = trace
+        self.timer = None
+
+    def close(self):
+        interface = self.dap.interface
+        try:
+            self.dap.uninit()
+        finally:
+            interface.close()
+
+
+class SessionPool(object):
+    """
+    Initialized DAPLink connections kept after their client releases
+    them, so a client asking for the same board and settings can reuse
+    them without initializing the probe again. Sessions are closed after
+    being idle for idle seconds.
+    """
+    def __init__(self, idle):
+        self.idle = idle
+        self._lock = Lock()
+        self._sessions = {}
+
+    def park(self, key, session):
+        """ Keeps an unused session warm under key. """
+        session.dap.flush()
+
+        with self._lock:
+            previous = self._sessions.pop(key, None)
+            session.timer = Timer(self.idle, self._expire, (key, session))
+            session.timer.daemon = True
+            session.timer.start()
+            self._sessions[key] = session
+
+        if previous:
+            self._close(key, previous)
+        logging.debug('session %s parked', key)
+
+    def claim(self, key, settings):
+        """
+        Returns the session parked under key if it was made with the same
+        settings. Sessions with other settings are closed, returns None.
+        """
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session:
+                session.timer.cancel()
+
+        if not session:
+            return None
+
+        if session.settings != settings:
+            self._close(key, session)
+            return None
+
+        logging.debug('session %s resumed', key)
+        return session
+
+    def _expire(self, key, session):
+        with self._lock:
+            if self._sessions.get(key) is not session:
+                return
+            del self._sessions[key]
+
+        logging.debug('session %s idle', key)
+        self._close(key, session)
+
+    def _close(self, key, session):
+        try:
+            session.close()
+        except Exception as e:
+            logging.warning('session %s not closed cleanly: %s', key, e)
+
+    def close(self):
+        """ Closes all parked sessions. """
+        with self._lock:
+            sessions = self._sessions.items()
+            self._sessions = {}
+
+        for key, session in sessions:
+            session.timer.cancel()
+            session.timer.join()
+            self._close(key, session)
@@ -0,0 +1,248 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from ..daplink.protocol import COMMAND_ID
+from ..socket.tcp_socket import TCPSocket
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+import logging
+
+
+# Command latencies are counted in power-of-two buckets of microseconds.
+# Bucket n holds latencies below LATENCY_BUCKETS[n], the last bucket
+# holds everything else.
+LATENCY_BUCKETS = [2**n for n in xrange(24)]
+
+DAP_TRANSFER = COMMAND_ID['DAP_TRANSFER']
+
+
+class CommandStats(object):
+    """ Preaggregated counters for a single server command. """
+    __slots__ = ('count', 'errors', 'time', 'latency')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.time = 0.0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def snapshot(self):
+        return {'count': self.count,
+                'errors': self.errors,
+                'time': self.time,
+                'latency': list(self.latency)}
+
+
+class Stats(object):
+    """
+    Counters for either a single client or a single board.
+
+    Updates only touch integers and preallocated lists so collection
+    is cheap enough to stay enabled. Formatting is deferred until
+    a snapshot is requested.
+    """
+    def __init__(self):
+        self.commands = {}
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.transfer_errors = 0
+        # DAP_Transfer request count -> number of packets
+        self.flushes = {}
+
+    def command(self, command, elapsed, error=False):
+        try:
+            stats = self.commands[command]
+        except KeyError:
+            stats = self.commands.setdefault(command, CommandStats())
+
+        stats.count += 1
+        stats.time += elapsed
+        if error:
+            stats.errors += 1
+
+        bucket = int(elapsed * 1e6).bit_length()
+        stats.latency[min(bucket, len(LATENCY_BUCKETS))] += 1
+
+    def snapshot(self):
+        return {'commands': {command: stats.snapshot()
+                             for command, stats in self.commands.items()},
+                'packets_sent': self.packets_sent,
+                'packets_received': self.packets_received,
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'transfer_errors': self.transfer_errors,
+                'flushes': {str(size): count
+                            for size, count in self.flushes.items()}}
+
+
+class StatsInterface(object):
+    """
+    Wraps an interface to count the USB packets passing through it.
+    Everything other than write/read is passed to the underlying interface.
+    """
+    def __init__(self, interface, stats):
+        self._interface = interface
+        self._stats = stats
+
+    def write(self, data):
+        # Measured before writing since backends pad the data in place
+        size = len(data)
+        for stats in self._stats:
+            stats.packets_sent += 1
+            stats.bytes_sent += size
+
+            if data[0] == DAP_TRANSFER:
+                stats.flushes[data[2]] = stats.flushes.get(data[2], 0) + 1
+
+        self._interface.write(data)
+
+    def read(self, *args, **kwargs):
+        data = self._interface.read(*args, **kwargs)
+
+        size = len(data)
+        for stats in self._stats:
+            stats.packets_received += 1
+            stats.bytes_received += size
+
+        return data
+
+    def setStats(self, stats):
+        """ Counts further packets in stats instead. """
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._interface, name)
+
+
+class ServerStats(object):
+    """ Registry of the per client and per board statistics of a server. """
+    def __init__(self):
+        self._lock = Lock()
+        self._clients = {}
+        self._boards = {}
+        self._next_client = 1
+
+    def client(self):
+        """ Creates statistics for a new client, returns id and stats. """
+        with self._lock:
+            id = self._next_client
+            self._next_client += 1
+            self._clients[id] = Stats()
+            return id, self._clients[id]
+
+    def release(self, id):
+        with self._lock:
+            self._clients.pop(id, None)
+
+    def board(self, vid, pid, id):
+        """ Statistics for a board, kept for the lifetime of the server. """
+        key = '%04x:%04x:%x' % (vid, pid, id)
+
+        with self._lock:
+            if key not in self._boards:
+                self._boards[key] = Stats()
+            return self._boards[key]
+
+    def snapshot(self):
+        with self._lock:
+            clients = self._clients.items()
+            boards = self._boards.items()
+
+        return {'latency_buckets': LATENCY_BUCKETS,
+                'clients': {str(id): stats.snapshot() for id, stats in clients},
+                'boards': {key: stats.snapshot() for key, stats in boards}}
+
+    def exposition(self):
+        """ Formats the statistics as Prometheus-style text exposition. """
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, labels, value):
+            lines.append('pydaplink_%s{%s} %s' % (name,
+                ','.join('%s="%s"' % label for label in labels), value))
+
+        for scope in ('clients', 'boards'):
+            for id, stats in sorted(snapshot[scope].items()):
+                labels = [('scope', scope[:-1]), ('id', id)]
+
+                for command, cstats in sorted(stats['commands'].items()):
+                    clabels = labels + [('command', command)]
+                    metric('commands_total', clabels, cstats['count'])
+                    metric('command_errors_total', clabels, cstats['errors'])
+                    metric('command_seconds_sum', clabels, repr(cstats['time']))
+
+                    total = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ['+Inf'],
+                                            cstats['latency']):
+                        total += count
+                        le = bound if bound == '+Inf' else repr(bound / 1e6)
+                        metric('command_seconds_bucket',
+                               clabels + [('le', le)], total)
+
+                for name in ('packets_sent', 'packets_received',
+                             'bytes_sent', 'bytes_received',
+                             'transfer_errors'):
+                    metric('%s_total' % name, labels, stats[name])
+
+                for size, count in sorted(stats['flushes'].items(),
+                                          key=lambda flush: int(flush[0])):
+                    metric('flushes_total', labels + [('size', size)], count)
+
+        return '\n'.join(lines) + '\n'
+
+
+class StatsExposition(object):
+    """
+    Serves a server's statistics as plain text over HTTP for scraping.
+    Defaults to restricting access to localhost.
+    """
+    def __init__(self, stats, address='localhost:4117'):
+        self.stats = stats
+        self.address = address
+
+    def open(self):
+        stats = self.stats
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                data = stats.exposition()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logging.debug('stats: ' + format, *args)
+
+        family, _, address = TCPSocket.getaddrinfo(self.address)
+
+        class Server(HTTPServer):
+            address_family = family
+
+        self._server = Server(address, Handler)
+
+        self._thread = Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._thread.join()
+        self._server.server_close()
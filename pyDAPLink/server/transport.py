@@ -16,9 +16,19 @@
 """
 
 from ..daplink import DAPLinkCore
-from ..errors import CommandError
+from ..daplink.protocol import READ_TIMEOUT
+from ..errors import CommandError, TransferError, TimeoutError
+from ..utility.encoding import COMPRESS_THRESHOLD
 from .selection import IfSelection
+from .registry import DeviceRegistry
+from .sessions import Session
+from .worker import ProbeWorker
+from ..interface.trace import TraceRecorder, TraceInterface
+from .stats import StatsInterface
+from time import time
 import logging
+import os
+import sys
 
 from .._version import version as __version__
 
@@ -43,41 +53,179 @@ def command(func):
     COMMANDS[command] = wrapper
 
 
+# Reads poll_until can repeat
+POLL_TYPES = ('dp', 'ap', 8, 16, 32)
+
+
 class DAPLinkServerTransport(object):
-    def __init__(self, interface):
-        """ Create connection. """
+    def __init__(self, interface, stats, trace=None, trace_capacity=4096,
+                       index=None, sessions=None, workers=False):
+        """
+        Create connection. If trace is a directory, the last trace_capacity
+        packets of initialized boards are recorded and dumped there on errors.
+        If index is a BoardIndex, board ids are kept in it. If sessions is
+        a SessionPool, released DAPLink connections are kept warm in it.
+        If workers is true, each initialized board runs in its own process.
+        """
         self._interface = interface
+        self._server_stats = stats
+        self._index = index
+        self._sessions = sessions
+        self._workers = workers
+        self._trace = trace
+        self._trace_capacity = trace_capacity
 
     def init(self):
         """ Sets up client connection. """
         self.ifs = None
         self.id = None
         self.dap = None
+        self.trace = None
+        self._settings = None
+        # Responses are only compressed once the client asks for it
+        self.threshold = None
+
+        self.client_id, self.stats = self._server_stats.client()
+        self._stats = (self.stats,)
 
         logging.info('client connected')
 
     def uninit(self):
         """ Tears down client connection. """
         if self.dap:
-            interface = self.dap.interface
-            self.dap.uninit()
-            interface.close()
+            self._release()
+
+        self._server_stats.release(self.client_id)
 
         logging.info('client disconnected')
 
     def handle(self, data):
-        if data['command'] not in COMMANDS:
-            raise CommandError('Unsupported command: %s' % data['command'])
+        command = data['command']
+        if command not in COMMANDS:
+            raise CommandError('Unsupported command: %s' % command)
+
+        logging.debug('command: %s', command)
+
+        error = True
+        start = time()
+        try:
+            resp = COMMANDS[command](self, data)
+            error = False
+            return resp
+        except CommandError:
+            raise
+        except Exception as err:
+            exc = sys.exc_info()
+            if isinstance(err, TransferError):
+                for stats in self._stats:
+                    stats.transfer_errors += 1
+
+            try:
+                if self.trace:
+                    self._dumpTrace('error')
+            except Exception:
+                # The original error is more useful than the dump's
+                logging.exception('trace not written')
+            finally:
+                if isinstance(err, TimeoutError):
+                    self._recycle()
+            raise exc[0], exc[1], exc[2]
+        finally:
+            elapsed = time() - start
+            for stats in self._stats:
+                stats.command(command, elapsed, error)
+
+
+    def _recycle(self):
+        """
+        Drops the DAPLink connection and releases the board after the
+        probe stops responding, the client must init the board again.
+        """
+        logging.warning('board %04x:%04x:%x timed out, releasing it',
+                        self.ifs.vid, self.ifs.pid, self.id)
+        if self.dap:
+            interface = self.dap.interface
+            self.dap = None
+            self.trace = None
+            try:
+                interface.close()
+            except Exception:
+                pass
 
-        logging.debug('command: %s', data['command'])
-        return COMMANDS[data['command']](self, data)
+        try:
+            self.ifs.deselect(self.id)
+        except KeyError:
+            pass
+
+        self.id = None
+        self._stats = (self.stats,)
+
+    def _release(self):
+        """
+        Closes the DAPLink connection, or keeps it warm for the next
+        client if the server keeps sessions.
+        """
+        session = Session(self.dap, self._settings, self.trace)
+        self.dap = None
+        self.trace = None
+
+        if self._sessions and self.id is not None:
+            try:
+                self._sessions.park((self.ifs.vid, self.ifs.pid, self.id),
+                                    session)
+                return
+            except Exception as e:
+                logging.debug('session not kept: %s', e)
+
+        session.close()
+
+    def _dumpTrace(self, name):
+        path = os.path.join(self._trace, 'trace-%04x-%04x-%x-%s.dapt' %
+                            (self.ifs.vid, self.ifs.pid, self.id, name))
+        self.trace.dump(path)
+        logging.info('trace written to %s', path)
+        return path
 
 
     # Server information
     @command
     def server_info(self, data):
-        """ Gets the version of the server. """
-        return {'version': __version__}
+        """
+        Gets the version of the server. If the client lists zlib in
+        compression, responses of at least threshold bytes are compressed
+        from then on and the response includes the agreed compression.
+        """
+        resp = {'version': __version__}
+
+        if 'zlib' in data.get('compression', []):
+            self.threshold = data.get('threshold', COMPRESS_THRESHOLD)
+            resp['compression'] = 'zlib'
+
+        return resp
+
+    @command
+    def server_stats(self, data):
+        """
+        Gets the server's statistics per client and per board.
+        Latencies are histograms over the buckets in latency_buckets,
+        given in microseconds.
+        """
+        resp = self._server_stats.snapshot()
+        resp['client'] = self.client_id
+        return resp
+
+    @command
+    def ping(self, data):
+        """
+        Echoes payload and responds with size bytes of padding,
+        to measure the connection's latency and throughput.
+        """
+        resp = {}
+        if 'payload' in data:
+            resp['payload'] = data['payload']
+        if data.get('size'):
+            resp['padding'] = 'x' * data['size']
+        return resp
 
 
     # Board handling
@@ -88,24 +236,72 @@ class DAPLinkServerTransport(object):
 
         Lists all connected boards with the specified VID/PID
         as 16-bit IDs which can be used to get more information.
+        Connected boards are only rescanned after devices are added
+        or removed, unless refresh is specified.
+        If info is specified, the response also lists each board's
+        information as returned by board_info.
+        """
+        if data.get('refresh'):
+            DeviceRegistry(self._interface).invalidate()
+
+        ifs = IfSelection(data['vid'], data['pid'])
+        ifs.enumerate(self._interface, self._index)
+
+        self.ifs = ifs
+        ids = self.ifs.ids()
+
+        if data.get('info'):
+            return {'ids': ids,
+                    'boards': [self._boardInfo(id) for id in ids]}
+        return {'ids': ids}
+
+    @command
+    def board_find(self, data):
+        """
+        Sets VID and PID to use.
+
+        Finds the connected board with the specified VID/PID and
+        serial number. Responds with its ID and information as returned
+        by board_info, or a null ID if there is no such board.
         """
         ifs = IfSelection(data['vid'], data['pid'])
-        ifs.enumerate(self._interface)
+        ifs.enumerate(self._interface, self._index)
 
         self.ifs = ifs
-        return {'ids': self.ifs.ids()}
+        for id in self.ifs.ids():
+            if self.ifs[id].serial_number == data['serial']:
+                return {'id': id, 'board': self._boardInfo(id)}
+
+        return {'id': None}
+
+    def _useSelection(self, data):
+        """
+        Sets VID and PID to use if specified, so clients can reuse
+        cached ids without enumerating. Boards are only enumerated
+        if the id is not yet known.
+        """
+        if 'vid' in data and 'pid' in data:
+            ifs = IfSelection(data['vid'], data['pid'])
+            if data['id'] not in ifs.ids():
+                ifs.enumerate(self._interface, self._index)
+
+            self.ifs = ifs
 
     @command
     def board_select(self, data):
         """
-        Selects board with specified id.
+        Selects board with specified id, optionally setting VID and PID.
         Response is false if board is selected by another process.
         """
         # Erase id so it doesn't accidentally get used if error occurs
         self.id = None
+        self._stats = (self.stats,)
 
+        self._useSelection(data)
         if self.ifs.select(data['id']):
             self.id = data['id']
+            self._stats = (self.stats, self._server_stats.board(
+                    self.ifs.vid, self.ifs.pid, self.id))
             return {'selected': True}
         else:
             return {'selected': False}
@@ -118,18 +314,26 @@ class DAPLinkServerTransport(object):
             pass
 
         self.id = None
+        self._stats = (self.stats,)
 
     @command
     def board_info(self, data):
         """ 
         Returns the specified board's vendor name, product name,
-        and serial number.
+        serial number, and whether another client has selected it.
+        VID and PID to use can be set as for board_select.
         """
-        interface = self.ifs[data['id']]
+        self._useSelection(data)
+        return self._boardInfo(data['id'])
+
+    def _boardInfo(self, id):
+        interface = self.ifs[id]
 
-        return {'vendor':  interface.vendor_name,
+        return {'id':      id,
+                'vendor':  interface.vendor_name,
                 'product': interface.product_name,
-                'serial':  interface.serial_number}
+                'serial':  interface.serial_number,
+                'busy':    self.ifs.busy(id) and id != self.id}
 
 
     # DAPLink connection
@@ -137,17 +341,44 @@ class DAPLinkServerTransport(object):
     def dap_init(self, data):
         """ 
         Initializes a DAPLink connection. 
-        The DAP uses the frequency and packet_count if specified
+        The DAP uses the frequency, packet_count and read timeout
+        in milliseconds if specified. A connection kept warm by the
+        server is reused if it was initialized with the same settings.
         """
         frequency = data.get('frequency')
         packet_count = data.get('packet_count')
+        timeout = data.get('timeout', READ_TIMEOUT)
+        self._settings = (frequency, packet_count, timeout)
+
+        if self._sessions:
+            session = self._sessions.claim(
+                    (self.ifs.vid, self.ifs.pid, self.id), self._settings)
+            if session:
+                session.dap.interface.setStats(self._stats)
+                self.dap = session.dap
+                self.trace = session.trace
+                return
 
         interface = self.ifs[self.id]
-        if packet_count:
-            interface.setPacketCount(packet_count)
-        interface.open()
+        if self._workers:
+            self.dap = ProbeWorker(self._interface, interface, self._stats,
+                                   timeout, packet_count,
+                                   self._trace and self._trace_capacity)
+            if self._trace:
+                self.trace = self.dap
+        else:
+            if packet_count:
+                interface.setPacketCount(packet_count)
+            interface.open()
+
+            if self._trace:
+                self.trace = TraceRecorder(self._trace_capacity,
+                                           interface.getPacketSize())
+                interface = TraceInterface(interface, self.trace)
+
+            self.dap = DAPLinkCore(StatsInterface(interface, self._stats),
+                                   timeout)
 
-        self.dap = DAPLinkCore(interface)
         if frequency:
             self.dap.init(frequency)
         else:
@@ -156,10 +387,18 @@ class DAPLinkServerTransport(object):
     @command
     def dap_uninit(self, data):
         """ Uninitializes a DAPLink connection. """
-        interface = self.dap.interface
-        self.dap.uninit()
-        self.dap = None
-        interface.close()
+        self._release()
+
+    @command
+    def dap_trace(self, data):
+        """
+        Writes the packets recorded for the initialized board
+        to the server's trace directory. Responds with the path.
+        """
+        if not self.trace:
+            raise CommandError('Tracing is not enabled')
+
+        return {'path': self._dumpTrace('%d' % (time()*1000))}
 
     @command
     def dap_frequency(self, data):
@@ -275,3 +514,33 @@ class DAPLinkServerTransport(object):
 
         if reads:
             return {'reads': reads}
+
+    @command
+    def poll_until(self, data):
+        """
+        Reads a register or memory location until its value masked with
+        mask equals value, waiting interval milliseconds between reads,
+        or until timeout milliseconds pass. The kind of read is dp, ap,
+        or 8, 16 or 32 for memory. Responds with the value, only its
+        masked bits if the probe matched it, whether it matched, and any
+        data collected by earlier reads. A value that doesn't match in
+        time is not an error, the board stays initialized.
+        """
+        type = data.get('type', 32)
+        if type not in POLL_TYPES:
+            raise CommandError('Unsupported poll type: %s' % type)
+        mask, value = data['mask'], data['value']
+
+        resp = {}
+        reads = self.dap.flush()
+        if reads:
+            resp['reads'] = reads
+
+        # The probe retries the read itself before falling back to polling
+        result = self.dap.waitForValue(data['addr'], mask, value, type,
+                                       data.get('interval', 0),
+                                       data.get('timeout', 1000))
+
+        resp['value'] = result
+        resp['matched'] = (result & mask) == (value & mask)
+        return resp
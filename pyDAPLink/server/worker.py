@@ -0,0 +1,264 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+from ..daplink import DAPLinkCore
+from ..daplink.protocol import READ_TIMEOUT
+from ..interface.trace import TraceRecorder, TraceInterface
+from .stats import Stats, StatsInterface
+from multiprocessing import Process, Pipe
+from subprocess import Popen
+from time import sleep, time
+import _multiprocessing
+import logging
+import os
+import signal
+import stat
+import sys
+
+
+# DAPLinkCore methods forwarded to workers
+CALLS = frozenset(['init', 'uninit', 'info', 'reset', 'assertReset',
+                   'setClock', 'writeDP', 'readDP', 'writeAP', 'readAP',
+                   'writeMem', 'readMem', 'writeBlock32', 'readBlock32',
+                   'waitForValue', 'flush'])
+
+
+def _findBoard(interface, vid, pid, serial, path):
+    """ Enumerates the board again, interfaces are not passed between processes """
+    for board in interface.getConnectedInterfaces(vid, pid) or []:
+        if (board.path == path if path is not None
+                else board.serial_number == serial):
+            return board
+
+    raise IOError('Board %04x:%04x %s is not connected' % (vid, pid, serial))
+
+def _closeSockets(keep):
+    """
+    Closes the sockets a forked worker inherits, otherwise the server
+    never sees its clients disconnect.
+    """
+    for fds in ('/proc/self/fd', '/dev/fd'):
+        if os.path.isdir(fds):
+            fds = [int(fd) for fd in os.listdir(fds)]
+            break
+    else:
+        fds = xrange(3, min(os.sysconf('SC_OPEN_MAX'), 4096))
+
+    for fd in fds:
+        if fd > 2 and fd != keep:
+            try:
+                if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                    os.close(fd)
+            except OSError:
+                pass
+
+def _takeCounts(stats):
+    """ Returns and resets the packet counters of stats """
+    counts = (stats.packets_sent, stats.packets_received,
+              stats.bytes_sent, stats.bytes_received, stats.flushes)
+    stats.packets_sent = stats.packets_received = 0
+    stats.bytes_sent = stats.bytes_received = 0
+    stats.flushes = {}
+    return counts
+
+def _workerTask(conn, interface, vid, pid, serial, path,
+                packet_count, timeout, trace_capacity):
+    # The front end closes workers, interrupts are left to it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if os.name == 'posix':
+        _closeSockets(conn.fileno())
+
+    stats = Stats()
+    board = None
+    trace = None
+
+    try:
+        board = _findBoard(interface, vid, pid, serial, path)
+        if packet_count:
+            board.setPacketCount(packet_count)
+        board.open()
+
+        wrapped = board
+        if trace_capacity:
+            trace = TraceRecorder(trace_capacity, board.getPacketSize())
+            wrapped = TraceInterface(board, trace)
+
+        dap = DAPLinkCore(StatsInterface(wrapped, (stats,)), timeout)
+        conn.send((None, None, _takeCounts(stats)))
+    except Exception as e:
+        conn.send((e, None, _takeCounts(stats)))
+        if board:
+            board.close()
+        return
+
+    while True:
+        try:
+            call, args = conn.recv()
+        except EOFError:
+            call, args = 'close', ()
+
+        error, result = None, None
+        try:
+            if call == 'close':
+                board.close()
+            elif call == 'setPacketCount':
+                board.setPacketCount(*args)
+            elif call == 'dump':
+                trace.dump(*args)
+            else:
+                result = getattr(dap, call)(*args)
+        except Exception as e:
+            error = e
+
+        try:
+            conn.send((error, result, _takeCounts(stats)))
+        except IOError:
+            break
+
+        if call == 'close':
+            break
+
+def main():
+    """ Runs a worker in a new interpreter, over the connection in argv. """
+    conn = _multiprocessing.Connection(int(sys.argv[1]))
+    _workerTask(conn, *conn.recv())
+
+
+class ProbeWorker(object):
+    """
+    A DAPLinkCore running in a dedicated process, so busy probes don't
+    contend for the server's interpreter. Calls are forwarded over a pipe.
+    The worker stands in for both the DAPLinkCore and its interface,
+    packet statistics are counted in stats.
+
+    On posix the worker is a new interpreter rather than a fork of the
+    server, locks held by the server's other threads at fork time would
+    never be released in the child.
+    """
+    def __init__(self, interface, board, stats, timeout=READ_TIMEOUT,
+                 packet_count=None, trace_capacity=None):
+        self._stats = stats
+        self._conn, conn = Pipe()
+        args = (interface, board.vid, board.pid, board.serial_number,
+                board.path, packet_count, timeout, trace_capacity)
+
+        if os.name == 'posix':
+            # The worker closes the other inherited sockets itself
+            env = dict(os.environ)
+            root = os.path.dirname(os.path.dirname(os.path.dirname(
+                    os.path.abspath(__file__))))
+            env['PYTHONPATH'] = os.pathsep.join(
+                    [root] + filter(None, [env.get('PYTHONPATH')]))
+            self._process = Popen([sys.executable, '-m',
+                                   'pyDAPLink.server.worker',
+                                   str(conn.fileno())], env=env)
+            conn.close()
+            self._conn.send(args)
+        else:
+            # Processes are spawned rather than forked elsewhere
+            self._process = Process(target=_workerTask, args=(conn,) + args)
+            self._process.daemon = True
+            self._process.start()
+            conn.close()
+
+        try:
+            self._result()
+        except Exception:
+            self._join()
+            raise
+
+        logging.debug('worker %d started for %s',
+                      self._process.pid, board.serial_number)
+
+    def _isalive(self):
+        if isinstance(self._process, Popen):
+            return self._process.poll() is None
+        return self._process.is_alive()
+
+    def _join(self, timeout=None):
+        if not isinstance(self._process, Popen):
+            return self._process.join(timeout)
+
+        deadline = None if timeout is None else time() + timeout
+        while self._process.poll() is None:
+            if deadline is not None and time() >= deadline:
+                break
+            sleep(0.01)
+
+    def _result(self):
+        try:
+            error, result, counts = self._conn.recv()
+        except EOFError:
+            raise IOError('Worker %d exited' % self._process.pid)
+
+        packets_sent, packets_received, bytes_sent, bytes_received, \
+                flushes = counts
+        for stats in self._stats:
+            stats.packets_sent += packets_sent
+            stats.packets_received += packets_received
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            for size, count in flushes.iteritems():
+                stats.flushes[size] = stats.flushes.get(size, 0) + count
+
+        if error:
+            raise error
+        return result
+
+    def _call(self, call, *args):
+        if not self._isalive():
+            raise IOError('Worker %d exited' % self._process.pid)
+
+        self._conn.send((call, args))
+        return self._result()
+
+    def __getattr__(self, name):
+        if name not in CALLS:
+            raise AttributeError(name)
+        return lambda *args: self._call(name, *args)
+
+    @property
+    def interface(self):
+        return self
+
+    def setStats(self, stats):
+        """ Counts further packets in stats instead. """
+        self._stats = stats
+
+    def setPacketCount(self, count):
+        self._call('setPacketCount', count)
+
+    def dump(self, path):
+        """ Writes the worker's trace to path. """
+        self._call('dump', path)
+
+    def close(self):
+        """ Closes the board and stops the worker. """
+        if self._isalive():
+            try:
+                self._call('close')
+            finally:
+                self._join(1.0)
+                if self._isalive():
+                    self._process.terminate()
+                    self._join()
+
+        self._conn.close()
+
+
+if __name__ == '__main__':
+    main()
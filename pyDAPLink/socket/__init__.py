@@ -17,10 +17,11 @@
 
 from unix_socket import UnixSocket
 from tcp_socket import TCPSocket
+from shm_socket import ShmSocket
 
 SOCKET = \
     { socket.name: socket 
-      for socket in (UnixSocket, TCPSocket)
+      for socket in (UnixSocket, TCPSocket, ShmSocket)
       if socket.available }
 
 # Default sockets defined in order of preference
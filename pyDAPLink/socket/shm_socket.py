@@ -0,0 +1,316 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+# Needed for importing both socket and .socket
+from __future__ import absolute_import
+
+import mmap
+import os
+import socket
+import struct
+import tempfile
+from select import select
+from time import time
+from .socket import Socket
+from .unix_socket import UnixConnection, UnixClient, UnixServer, UnixSocket
+
+
+# Bytes buffered in each direction, larger messages are passed in pieces
+RING_SIZE = 4*1024*1024
+
+# Each ring starts with the bytes written, the bytes read, whether the
+# writer waits for space and whether the reader waits for data, followed
+# by the data at the next cache line
+COUNT = struct.Struct('<Q')
+WRITTEN = 0
+READ = 8
+WAITING = 16
+SLEEPING = 24
+HEADER_SIZE = 64
+
+# Messages are prefixed with their length
+LENGTH = struct.Struct('<I')
+
+# Seconds a writer waits for space before checking the ring again,
+# in case it missed the reader's doorbell
+WAIT_INTERVAL = 0.01
+
+# Longest a sleeping reader waits before checking the ring again. The
+# flags are plain shared memory without fences, so a doorbell can be
+# missed if the reader goes to sleep just as the writer checks.
+SLEEP_INTERVAL = 0.1
+
+SHM_PATH = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+class Ring(object):
+    """ Single producer, single consumer ring of bytes in shared memory. """
+    def __init__(self, map, offset, size=RING_SIZE):
+        self._map = map
+        self._offset = offset
+        self._data = offset + HEADER_SIZE
+        self.size = size
+
+    def _get(self, field):
+        return COUNT.unpack_from(self._map, self._offset + field)[0]
+
+    def _set(self, field, value):
+        COUNT.pack_into(self._map, self._offset + field, value)
+
+    @property
+    def waiting(self):
+        return self._get(WAITING)
+
+    @waiting.setter
+    def waiting(self, waiting):
+        self._set(WAITING, waiting)
+
+    @property
+    def sleeping(self):
+        return self._get(SLEEPING)
+
+    @sleeping.setter
+    def sleeping(self, sleeping):
+        self._set(SLEEPING, sleeping)
+
+    def available(self):
+        return self._get(WRITTEN) - self._get(READ)
+
+    def write(self, data, offset=0):
+        """
+        Writes as much of data from offset as fits, returns the number
+        of bytes written.
+        """
+        written = self._get(WRITTEN)
+        count = min(len(data) - offset, self.size - (written - self._get(READ)))
+        start = written % self.size
+        first = min(count, self.size - start)
+
+        # Slicing a whole string doesn't copy it
+        self._map[self._data+start:self._data+start+first] = \
+                data[offset:offset+first]
+        if count > first:
+            self._map[self._data:self._data+count-first] = \
+                    data[offset+first:offset+count]
+
+        self._set(WRITTEN, written + count)
+        return count
+
+    def read(self, size):
+        """
+        Reads up to size bytes, stopping at the end of the ring so the
+        data is sliced from the map without further copies.
+        """
+        read = self._get(READ)
+        start = read % self.size
+        count = min(size, self._get(WRITTEN) - read, self.size - start)
+
+        data = self._map[self._data+start:self._data+start+count]
+        self._set(READ, read + count)
+        return data
+
+
+class ShmConnection(UnixConnection):
+    """
+    Passes messages through a pair of rings in shared memory. The unix
+    socket the rings were negotiated over only carries doorbell bytes,
+    sent when a ring is written while its reader sleeps or when a
+    waiting writer has space again. A busy reader finds messages in the
+    ring without any system calls.
+    """
+    def _map(self, fd, tx, rx):
+        self._mmap = mmap.mmap(fd, 2*(HEADER_SIZE + RING_SIZE))
+        self._tx = Ring(self._mmap, tx*(HEADER_SIZE + RING_SIZE))
+        self._rx = Ring(self._mmap, rx*(HEADER_SIZE + RING_SIZE))
+
+    def _ring(self):
+        self._socket.sendall('\0')
+
+    def _wait(self, timeout=None):
+        """ Waits for a doorbell, returns False if the peer disconnected. """
+        if timeout is not None:
+            if not select([self._socket], [], [], timeout)[0]:
+                return True
+
+        if not self._socket.recv(4096):
+            self._isalive = False
+            return False
+        return True
+
+    def _write(self, *chunks):
+        """
+        Writes chunks to the ring, the doorbell is only rung once unless
+        the reader has to make space.
+        """
+        unrung = False
+        for data in chunks:
+            offset = 0
+            while offset < len(data):
+                count = self._tx.write(data, offset)
+                if count:
+                    offset += count
+                    self._tx.waiting = 0
+                    unrung = True
+                    continue
+
+                # The reader can only make space for what it knows about
+                if unrung and self._tx.sleeping:
+                    self._ring()
+                unrung = False
+
+                # Set before checking again so the reader can't miss us
+                self._tx.waiting = 1
+                count = self._tx.write(data, offset)
+                if count:
+                    offset += count
+                    unrung = True
+                elif not self._wait(WAIT_INTERVAL):
+                    raise IOError('Connection closed')
+
+        self._tx.waiting = 0
+        if unrung and self._tx.sleeping:
+            self._ring()
+
+    def _sleep(self):
+        """ Waits for the ring to be written, False if the peer disconnected. """
+        timeout = self._socket.gettimeout()
+        deadline = None if timeout is None else time() + timeout
+        interval = WAIT_INTERVAL
+
+        # Set before checking again so the writer can't miss us
+        self._rx.sleeping = 1
+        try:
+            while not self._rx.available():
+                if deadline is not None and time() >= deadline:
+                    raise socket.timeout('timed out')
+                if not self._wait(interval):
+                    return False
+                interval = min(2*interval, SLEEP_INTERVAL)
+        finally:
+            self._rx.sleeping = 0
+
+        return True
+
+    def _read(self, size):
+        """ Reads size bytes, returns None if the peer disconnected. """
+        chunks = []
+        while size:
+            data = self._rx.read(size)
+            if data:
+                chunks.append(data)
+                size -= len(data)
+                if self._rx.waiting:
+                    self._ring()
+            elif not self._sleep():
+                return None
+
+        # Joining a single string doesn't copy it, so a message read in
+        # one piece is only copied once, out of the map
+        return ''.join(chunks)
+
+    def send(self, data):
+        self._write(LENGTH.pack(len(data)), data)
+
+    def recv(self, size=None):
+        # Messages are received whole, size is ignored
+        header = self._read(LENGTH.size)
+        if header is None:
+            return ''
+
+        data = self._read(LENGTH.unpack(header)[0])
+        if data is None:
+            return ''
+        return data
+
+    def close(self):
+        UnixConnection.close(self)
+        if getattr(self, '_mmap', None):
+            self._mmap.close()
+            self._mmap = None
+
+
+class ShmServerConnection(ShmConnection):
+    """ Sets up the rings once the server accepted a unix connection. """
+    def __init__(self, socket):
+        UnixConnection.__init__(self, socket)
+
+        fd, path = tempfile.mkstemp(prefix='pydaplink-', dir=SHM_PATH)
+        try:
+            os.ftruncate(fd, 2*(HEADER_SIZE + RING_SIZE))
+            self._map(fd, 0, 1)
+        finally:
+            os.close(fd)
+
+        # The client removes the file once it has mapped it
+        self._path = path
+        try:
+            self._socket.sendall(path + '\n')
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        ShmConnection.close(self)
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+
+class ShmClient(ShmConnection, UnixClient):
+    def __init__(self, address='/tmp/pydaplink/shm', timeout=None):
+        UnixClient.__init__(self, address, timeout)
+
+    def open(self):
+        UnixClient.open(self)
+
+        path = ''
+        while not path.endswith('\n'):
+            data = self._socket.recv(4096)
+            if not data:
+                raise IOError('Server closed connection')
+            path += data
+
+        try:
+            fd = os.open(path[:-1], os.O_RDWR)
+            try:
+                self._map(fd, 1, 0)
+            finally:
+                os.close(fd)
+        finally:
+            os.unlink(path[:-1])
+
+class ShmServer(UnixServer):
+    def __init__(self, address='/tmp/pydaplink/shm', timeout=None):
+        UnixServer.__init__(self, address, timeout)
+
+    def accept(self):
+        conn = UnixServer.accept(self)
+        if not conn:
+            return None
+
+        return ShmServerConnection(conn._socket)
+
+
+class ShmSocket(Socket):
+    name = 'shm'
+    available = UnixSocket.available and os.name == 'posix'
+
+    addrisvalid = staticmethod(UnixSocket.addrisvalid)
+
+    Client = ShmClient
+    Server = ShmServer
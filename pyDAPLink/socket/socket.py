@@ -16,6 +16,47 @@
 """
 
 
+class MessageBuffer(object):
+    """
+    Receives newline terminated messages with recv_into a reusable
+    buffer, which grows to fit the largest message. Messages are
+    returned whole however they were split by the socket.
+    """
+    def __init__(self, size=4096):
+        self._buffer = bytearray(size)
+        self._start = 0
+        self._end = 0
+        # Bytes before this were already searched for a newline
+        self._scanned = 0
+
+    def recv(self, socket):
+        """ Returns the next message, or '' if the socket was closed. """
+        while True:
+            end = self._buffer.find('\n', self._scanned, self._end)
+            if end >= 0:
+                message = memoryview(self._buffer)[self._start:end+1].tobytes()
+                self._start = self._scanned = end+1
+                if self._start == self._end:
+                    self._start = self._end = self._scanned = 0
+                return message
+            self._scanned = self._end
+
+            if self._start:
+                # Move the partial message to the front
+                self._buffer[:self._end-self._start] = \
+                        self._buffer[self._start:self._end]
+                self._end -= self._start
+                self._scanned -= self._start
+                self._start = 0
+            elif self._end == len(self._buffer):
+                self._buffer.extend(self._buffer)
+
+            count = socket.recv_into(memoryview(self._buffer)[self._end:])
+            if not count:
+                return ''
+            self._end += count
+
+
 class Connection(object):
     def send(self, data):
         return
@@ -68,6 +109,8 @@ class Server(object):
 class Socket(object):
     name = None
     available = False
+    # Named sets of socket options, passed to Client and Server as profile
+    profiles = {}
 
     @staticmethod
     def addrisvalid(address):
@@ -21,20 +21,95 @@ from __future__ import absolute_import
 import os
 import socket
 from select import select
-from .socket import Connection, Server, Client, Socket
+from .socket import Connection, Server, Client, Socket, MessageBuffer
 from ..utility import socket_pair
 
 
+# Socket options of each TCP profile. Without nodelay, Nagle's algorithm
+# holds small messages back until the previous one is acknowledged,
+# which together with delayed acknowledgements stalls request/response
+# traffic for tens of milliseconds.
+PROFILES = {
+    # Commands sent as soon as they are written
+    'interactive': {'nodelay': True, 'keepalive': True},
+    # Messages held back until a reply is awaited, then sent in full segments
+    'batch': {'cork': True, 'keepalive': True},
+    # Large socket buffers for block transfers
+    'bulk': {'nodelay': True, 'keepalive': True, 'buffer_size': 2**20},
+    # Operating system defaults
+    'plain': {},
+}
+DEFAULT_PROFILE = 'interactive'
+
+# Seconds before an idle peer is probed, seconds between probes and
+# unanswered probes before the peer is considered dead
+KEEPALIVE = (30, 5, 3)
+
+# Corking is only available on Linux, elsewhere messages are
+# sent immediately since each message is a single write
+TCP_CORK = getattr(socket, 'TCP_CORK', None)
+
+
+def configure_buffers(sock, profile):
+    """
+    Applies a profile's buffer sizes, these must be set before connecting
+    and are inherited by accepted connections.
+    """
+    options = PROFILES[profile]
+
+    if options.get('buffer_size'):
+        for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            sock.setsockopt(socket.SOL_SOCKET, option, options['buffer_size'])
+
+
+def configure(sock, profile):
+    """
+    Applies a profile's per-connection socket options, returns whether
+    the connection is corked.
+    """
+    options = PROFILES[profile]
+
+    if options.get('nodelay') or (options.get('cork') and TCP_CORK is None):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    if options.get('keepalive'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for name, value in zip(('TCP_KEEPIDLE', 'TCP_KEEPINTVL', 'TCP_KEEPCNT'),
+                               KEEPALIVE):
+            if hasattr(socket, name):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+    if options.get('cork') and TCP_CORK is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, TCP_CORK, 1)
+        return True
+    return False
+
+
 class TCPConnection(Connection):
-    def __init__(self, socket):
+    def __init__(self, socket, profile=DEFAULT_PROFILE):
         self._socket = socket
         self._isalive = True
+        self._messages = MessageBuffer()
+        self._cork = configure(socket, profile)
+        self._corked = False
 
     def send(self, data):
         self._socket.sendall(data)
+        self._corked = self._cork
+
+    def flush(self):
+        """ Sends what corked messages are left in partial segments. """
+        if self._corked:
+            self._corked = False
+            self._socket.setsockopt(socket.IPPROTO_TCP, TCP_CORK, 0)
+            self._socket.setsockopt(socket.IPPROTO_TCP, TCP_CORK, 1)
 
     def recv(self, size=2**16):
-        data = self._socket.recv(size)
+        # The peer can't reply to messages still held back
+        self.flush()
+
+        # Messages are received whole, size is ignored
+        data = self._messages.recv(self._socket)
         if not data:
             self._isalive = False
 
@@ -57,8 +132,10 @@ class TCPConnection(Connection):
         self._socket.close()
 
 class TCPClient(TCPConnection, Client):
-    def __init__(self, address='localhost:4116', timeout=None):
+    def __init__(self, address='localhost:4116', timeout=None,
+                       profile=DEFAULT_PROFILE):
         self.address = address
+        self.profile = profile
         self._isalive = False
         self._timeout = timeout
 
@@ -66,15 +143,19 @@ class TCPClient(TCPConnection, Client):
         family, type, address = TCPSocket.getaddrinfo(self.address)
         conn = socket.socket(family, type)
         conn.settimeout(self._timeout)
+        # Buffer sizes must be set before connecting to take effect
+        configure_buffers(conn, self.profile)
         conn.connect(address)
 
-        TCPConnection.__init__(self, conn)
+        TCPConnection.__init__(self, conn, self.profile)
 
 class TCPServer(Server):
     # defaults to restricting access to localhost if remote access
     # is needed, an address without hostname, such as ':4116', can be used
-    def __init__(self, address='localhost:4116', timeout=None):
+    def __init__(self, address='localhost:4116', timeout=None,
+                       profile=DEFAULT_PROFILE):
         self.address = address
+        self.profile = profile
         self._isalive = False
         self._timeout = timeout
     
@@ -87,6 +168,8 @@ class TCPServer(Server):
         self._socket = socket.socket(family, type)
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._socket.settimeout(self._timeout)
+        # Accepted connections inherit the buffer sizes
+        configure_buffers(self._socket, self.profile)
         self._socket.bind(address)
         self._socket.listen(socket.SOMAXCONN)
 
@@ -101,7 +184,7 @@ class TCPServer(Server):
 
         conn, _ = self._socket.accept()
         conn.settimeout(self._timeout)
-        return TCPConnection(conn)
+        return TCPConnection(conn, self.profile)
 
     def settimeout(self, timeout):
         self._socket.settimeout(timeout)
@@ -123,6 +206,7 @@ class TCPServer(Server):
 class TCPSocket(Socket):
     name = 'tcp'
     available = True
+    profiles = PROFILES
 
     @staticmethod
     def addrisvalid(address):
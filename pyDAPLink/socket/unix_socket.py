@@ -22,7 +22,7 @@ import os
 import stat
 import socket
 from select import select
-from .socket import Connection, Server, Client, Socket
+from .socket import Connection, Server, Client, Socket, MessageBuffer
 from ..utility import socket_pair
 
 
@@ -30,12 +30,14 @@ class UnixConnection(Connection):
     def __init__(self, socket):
         self._socket = socket
         self._isalive = True
+        self._messages = MessageBuffer()
 
     def send(self, data):
         self._socket.sendall(data)
 
     def recv(self, size=2**16):
-        data = self._socket.recv(size)
+        # Messages are received whole, size is ignored
+        data = self._messages.recv(self._socket)
         if not data:
             self._isalive = False
 
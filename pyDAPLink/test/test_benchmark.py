@@ -19,6 +19,8 @@ import pytest
 from pyDAPLink import DAPLink
 from pyDAPLink import READ_START, READ_END
 from pyDAPLink.daplink import DP_REG, AP_REG
+from pyDAPLink.tools import pydaplink_bench
+from pyDAPLink.interface.simulated_backend import OPTIONS
 from numbers import Integral
 from random import randint
 from time import time
@@ -190,3 +192,23 @@ class TestBenchmark:
             "%.3f seconds" % (stop - start),
             "%.3f B/s" % ((4*len(write_data))/(stop - start)))
 
+
+
+class TestHostBenchmark:
+    @pytest.mark.parametrize('layer', ['protocol', 'core', 'json', 'unix', 'tcp'])
+    def test_host_benchmark(self, layer):
+        boards = OPTIONS['boards']
+        results = pydaplink_bench.run(1, layer)
+
+        assert results and all(name.startswith(layer) for name in results)
+        # The simulated probes are left as they were
+        assert OPTIONS['boards'] == boards
+        assert all(result['best'] > 0 and result['median'] >= result['best']
+                   for result in results.values())
+
+    def test_host_benchmark_compare(self):
+        baseline = {'a': {'median': 1.0}, 'b': {'median': 1.0}}
+        results = {'a': {'median': 1.1}, 'b': {'median': 1.5},
+                   'c': {'median': 9.9}}
+
+        assert pydaplink_bench.compare(results, baseline, 0.2) == ['b']
@@ -19,6 +19,7 @@ import pytest
 from pyDAPLink import DAPLink
 from pyDAPLink import READ_START, READ_END
 from pyDAPLink.daplink import DP_REG, AP_REG
+from pyDAPLink.errors import TimeoutError, PollTimeout
 from pyDAPLink.socket import SOCKET
 from pyDAPLink.interface import INTERFACE
 from numbers import Integral
@@ -121,5 +122,73 @@ class TestClients:
         board.uninit()
         client.uninit()
 
+    def test_poll_until(self, vid, pid):
+        client = DAPLink()
+        client.init()
+
+        board = client.getConnectedBoards(vid, pid)[0]
+        board.init()
+        board.writeDP(DP_REG['SELECT'], 0)
+        board.writeDP(DP_REG['CTRL_STAT'], CPWRUPREQ)
+
+        value = board.pollUntil(DP_REG['CTRL_STAT'], CPWRUPACK, CPWRUPACK, 'dp')
+        assert value & CPWRUPACK == CPWRUPACK
+
+        board.writeMem(DCRDR, 0x1234)
+        with pytest.raises(PollTimeout) as error:
+            board.pollUntil(DCRDR, 0xffff, 0x4321, timeout=10)
+        assert not isinstance(error.value, TimeoutError)
+
+        # A poll miss leaves the board initialized
+        assert board.readMem(DCRDR) == 0x1234
+
+        board.uninit()
+        client.uninit()
+
+    def test_compression(self, vid, pid):
+        client = DAPLink(compression=64)
+        client.init()
+
+        board = client.getConnectedBoards(vid, pid)[0]
+        board.init()
+        # Writes and reads are compressed both ways
+        data = [0]*1000 + [0xffffffff]*1000
+        board.writeBlock32(0x20000000, data)
+        assert board.readBlock32(0x20000000, len(data)) == data
+        board.uninit()
+
+        client.uninit()
+
+    def test_find_board(self, vid, pid):
+        client = DAPLink()
+        client.init()
+
+        boards = client.getConnectedBoards(vid, pid)
+        board = client.findBoard(vid, pid, boards[-1].serial_number)
+        assert board.iid == boards[-1].iid
+        assert board.serial_number == boards[-1].serial_number
+        assert not board.busy
+
+        assert client.findBoard(vid, pid, 'no such board') is None
+
+        client.uninit()
+
+    def test_get_board(self, vid, pid):
+        client = DAPLink()
+        client.init()
+        boards = client.getConnectedBoards(vid, pid)
+        client.uninit()
 
-        
+        # Ids from another connection are reused without enumerating
+        client = DAPLink()
+        client.init()
+
+        board = client.getBoard(vid, pid, boards[-1].iid)
+        assert board.serial_number == boards[-1].serial_number
+        for i in xrange(2):
+            board.init()
+            board.uninit()
+
+        assert client.getBoard(vid, pid, 0xffff) is None
+
+        client.uninit()
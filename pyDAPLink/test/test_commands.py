@@ -37,8 +37,8 @@ MEM_ADDR = {'DCRDR': 0xE000EDF8}
 
 @pytest.fixture(scope='function')
 def server(request):
-    """ Server for testing """
-    server = DAPLinkServer()
+    """ Server for testing, configured by indirect parameters """
+    server = DAPLinkServer(**getattr(request, 'param', {}))
     server.init()
     def cleanup():
         server.uninit()
@@ -111,6 +111,38 @@ class TestCommands:
         assert 'response' in response and response['response'] == 'server_info'
         assert 'version' in response and isinstance(response['version'], basestring)
 
+    def test_server_stats(self, command):
+        command({'command': 'server_info'})
+        response = command({'command': 'server_stats'})
+
+        assert 'response' in response and response['response'] == 'server_stats'
+        assert 'client' in response and isinstance(response['client'], Integral)
+        assert 'clients' in response and isinstance(response['clients'], dict)
+        assert 'boards' in response and isinstance(response['boards'], dict)
+
+        stats = response['clients'][str(response['client'])]
+        assert stats['commands']['server_info']['count'] == 1
+        assert sum(stats['commands']['server_info']['latency']) == 1
+
+    def test_server_info_compression(self, socket, command):
+        response = command({'command': 'server_info',
+                            'compression': ['zlib'], 'threshold': 1000})
+        assert response['compression'] == 'zlib'
+
+        # Only large responses are compressed
+        socket.send(encode({'command': 'ping', 'size': 100}))
+        assert 'zlib' not in socket.recv()
+        socket.send(encode({'command': 'ping', 'size': 10000}))
+        response = socket.recv()
+        assert 'zlib' in response and len(response) < 1000
+        assert len(decode(response, True)['padding']) == 10000
+
+    def test_ping(self, command):
+        response = command({'command': 'ping', 'payload': 'abc', 'size': 1000})
+
+        assert response['payload'] == 'abc'
+        assert len(response['padding']) == 1000
+
 
     def test_board_enumerate(self, command, vid, pid):
         response = command({'command': 'board_enumerate',
@@ -151,6 +183,41 @@ class TestCommands:
         assert 'vendor'  in response and isinstance(response['vendor'],  basestring)
         assert 'product' in response and isinstance(response['product'], basestring)
         assert 'serial'  in response and isinstance(response['serial'],  basestring)
+        assert 'busy'    in response and response['busy'] == False
+
+    def test_board_enumerate_info(self, command, vid, pid):
+        response = command({'command': 'board_enumerate',
+                            'vid': vid,
+                            'pid': pid,
+                            'info': True})
+
+        assert 'boards' in response and isinstance(response['boards'], list)
+        assert [board['id'] for board in response['boards']] == response['ids']
+
+        for board in response['boards']:
+            info = command({'command': 'board_info', 'id': board['id']})
+            del info['response']
+            assert board == info
+
+    def test_board_find(self, command, vid, pid):
+        response = command({'command': 'board_enumerate', 'vid': vid, 'pid': pid})
+        id = response['ids'][0]
+        serial = command({'command': 'board_info', 'id': id})['serial']
+
+        response = command({'command': 'board_find',
+                            'vid': vid,
+                            'pid': pid,
+                            'serial': serial})
+
+        assert 'response' in response and response['response'] == 'board_find'
+        assert response['id'] == id
+        assert response['board']['serial'] == serial
+
+        response = command({'command': 'board_find',
+                            'vid': vid,
+                            'pid': pid,
+                            'serial': 'no such board'})
+        assert response['id'] is None
 
 
     def test_dap_init(self, command, vid, pid, frequency):
@@ -163,6 +230,81 @@ class TestCommands:
 
         assert 'response' in response and response['response'] == 'dap_init'
 
+    # Boards are released even if the trace can't be written
+    @pytest.mark.parametrize('server', [{}, {'trace': '/nonexistent/traces'}],
+                             indirect=True)
+    def test_dap_timeout(self, request, server, socket, command, vid, pid):
+        if server.interface != 'simulated':
+            pytest.skip('needs a probe that can stop responding')
+
+        from pyDAPLink.interface import SimulatedUSB
+
+        response = command({'command': 'board_enumerate', 'vid': vid, 'pid': pid})
+        id = response['ids'][0]
+        command({'command': 'board_select', 'id': id})
+        command({'command': 'dap_init', 'timeout': 50})
+
+        # Every response is lost from now on
+        serial = command({'command': 'board_info', 'id': id})['serial']
+        options = SimulatedUSB.probes[serial].options
+        options['stall'] = 1.0
+        request.addfinalizer(lambda: options.update(stall=0.0))
+
+        socket.send(encode({'command': 'dap_info', 'request': 'PACKET_COUNT'}))
+        response = decode(socket.recv())
+        assert response.get('error') == 'TimeoutError'
+
+        # The session is dropped and the board released for other clients
+        response = command({'command': 'board_select', 'id': id})
+        assert response['selected'] == True
+
+    @pytest.mark.parametrize('server', [{'workers': True}], indirect=True)
+    def test_dap_worker(self, command, vid, pid, frequency):
+        response = command({'command': 'board_enumerate', 'vid': vid, 'pid': pid})
+        id = response['ids'][0]
+        command({'command': 'board_select', 'id': id})
+        command({'command': 'dap_init', 'frequency': frequency})
+
+        command({'command': 'read_dp', 'addr': DP_REG['IDCODE']})
+        response = command({'command': 'flush'})
+        assert isinstance(response['reads'][0], Integral)
+
+        # Packets sent by the worker are counted by the server
+        response = command({'command': 'server_stats'})
+        stats = response['clients'][str(response['client'])]
+        assert stats['packets_sent'] > 0
+        assert stats['packets_sent'] == stats['packets_received']
+
+        command({'command': 'dap_uninit'})
+
+    @pytest.mark.parametrize('server', [{'session_idle': 10}], indirect=True)
+    def test_dap_session(self, command, vid, pid):
+        response = command({'command': 'board_enumerate', 'vid': vid, 'pid': pid})
+        id = response['ids'][0]
+        command({'command': 'board_select', 'id': id})
+
+        def packets():
+            response = command({'command': 'server_stats'})
+            return sum(board['packets_sent']
+                       for board in response['boards'].values())
+
+        command({'command': 'dap_init', 'frequency': 10**6})
+        command({'command': 'dap_uninit'})
+        sent = packets()
+
+        # The warm session is reused without talking to the probe
+        command({'command': 'dap_init', 'frequency': 10**6})
+        assert packets() == sent
+        command({'command': 'read_dp', 'addr': DP_REG['IDCODE']})
+        response = command({'command': 'flush'})
+        assert isinstance(response['reads'][0], Integral)
+        command({'command': 'dap_uninit'})
+        sent = packets()
+
+        # Other settings initialize the probe again
+        command({'command': 'dap_init', 'frequency': 10**7})
+        assert packets() > sent
+
     def test_dap_uninit(self, command, vid, pid, frequency):
         response = command({'command': 'board_enumerate', 'vid': vid, 'pid': pid})
         id = response['ids'][0]
@@ -254,6 +396,44 @@ class TestCommands:
 
         assert 'response' in response and response['response'] == 'flush'
 
+    def test_poll_until(self, command, vid, pid, frequency):
+        CPWRUPREQ = 0x50000000
+        CPWRUPACK = 0xa0000000
+
+        response = command({'command': 'board_enumerate', 'vid': vid, 'pid': pid})
+        id = response['ids'][0]
+        command({'command': 'board_select', 'id': id})
+        command({'command': 'dap_init', 'frequency': frequency})
+
+        command({'command': 'write_dp', 'addr': DP_REG['SELECT'], 'data': 0})
+        command({'command': 'write_dp', 'addr': DP_REG['CTRL_STAT'], 'data': CPWRUPREQ})
+        command({'command': 'read_dp', 'addr': DP_REG['IDCODE']})
+
+        response = command({'command': 'poll_until', 'type': 'dp',
+                            'addr': DP_REG['CTRL_STAT'],
+                            'mask': CPWRUPACK, 'value': CPWRUPACK})
+        assert response['matched']
+        assert response['value'] & CPWRUPACK == CPWRUPACK
+        # Earlier reads are still collected
+        assert len(response['reads']) == 1
+
+        # Bits of value outside of mask are ignored
+        response = command({'command': 'poll_until', 'type': 'dp',
+                            'addr': DP_REG['CTRL_STAT'],
+                            'mask': CPWRUPACK, 'value': 0xffffffff})
+        assert response['matched']
+
+        response = command({'command': 'poll_until', 'type': 'dp',
+                            'addr': DP_REG['CTRL_STAT'], 'mask': CPWRUPACK,
+                            'value': 0, 'interval': 5, 'timeout': 20})
+        assert not response['matched']
+        assert 'reads' not in response
+
+        # A miss is not an error, the board stays initialized
+        command({'command': 'read_dp', 'addr': DP_REG['IDCODE']})
+        response = command({'command': 'flush'})
+        assert isinstance(response['reads'][0], Integral)
+
     @pytest.mark.parametrize('reg', ['IDCODE', 'CTRL_STAT'])
     def test_read_dp(self, command, vid, pid, frequency, reg):
         response = command({'command': 'board_enumerate', 'vid': vid, 'pid': pid})
@@ -20,7 +20,11 @@ from pyDAPLink import DAPLinkServer
 from pyDAPLink import DAPLinkClient
 from pyDAPLink import DAPLink
 from pyDAPLink.socket import SOCKET
+from pyDAPLink.socket.socket import MessageBuffer
+from pyDAPLink.socket.tcp_socket import TCP_CORK
+from pyDAPLink.utility import socket_pair
 from pyDAPLink.interface import INTERFACE
+from threading import Thread
 import time
 
 
@@ -99,6 +103,8 @@ class TestConnections:
     def test_seperate_server(self, socket, interface, client_count, vid, pid):
         if socket == 'unix':
             address = '/tmp/pydaplink/test-socket'
+        elif socket == 'shm':
+            address = '/tmp/pydaplink/test-shm'
         else:
             address = 'localhost:1234'
 
@@ -133,3 +139,151 @@ class TestConnections:
 
         server.uninit()
 
+    def test_board_socket(self, socket, vid, pid):
+        address = {'unix': '/tmp/pydaplink/test-socket',
+                   'shm': '/tmp/pydaplink/test-shm'}.get(socket, 'localhost:1234')
+        server = DAPLinkServer(address=address, socket=socket,
+                               interface='simulated')
+        server.init()
+
+        client = DAPLinkClient(address=address, socket=socket,
+                               interface='simulated', create_server=False)
+        client.init()
+
+        # Boards open their own connection over the same socket type
+        board = client.getConnectedBoards(vid, pid)[0]
+        board.init()
+        assert board.info('PACKET_COUNT')
+        board.uninit()
+
+        client.uninit()
+        server.uninit()
+
+    @pytest.mark.skipif('shm' not in SOCKET, reason='needs shared memory')
+    def test_shm_large_message(self, tmpdir):
+        from pyDAPLink.socket.shm_socket import RING_SIZE
+
+        address = str(tmpdir.join('shm'))
+        server = SOCKET['shm'].Server(address)
+        server.open()
+
+        def echo():
+            conn = server.accept()
+            conn.send(conn.recv())
+            conn.close()
+        thread = Thread(target=echo)
+        thread.start()
+
+        # Messages larger than the rings are passed in pieces
+        client = SOCKET['shm'].Client(address)
+        client.open()
+        message = ''.join(chr(i % 251) for i in xrange(2*RING_SIZE + 3))
+        client.send(message)
+        assert client.recv() == message
+
+        thread.join()
+        client.close()
+        server.shutdown()
+        server.close()
+
+    @pytest.mark.skipif('shm' not in SOCKET, reason='needs shared memory')
+    def test_shm_doorbell(self, tmpdir, monkeypatch):
+        from pyDAPLink.socket.shm_socket import ShmConnection
+
+        rings = []
+        ring = ShmConnection._ring
+        def counted(self):
+            rings.append(self)
+            ring(self)
+        monkeypatch.setattr(ShmConnection, '_ring', counted)
+
+        address = str(tmpdir.join('shm'))
+        server = SOCKET['shm'].Server(address)
+        server.open()
+        conns = []
+        thread = Thread(target=lambda: conns.append(server.accept()))
+        thread.start()
+        client = SOCKET['shm'].Client(address)
+        client.open()
+        thread.join()
+        conn = conns[0]
+
+        # A reader that isn't waiting finds messages without doorbells
+        for i in xrange(100):
+            client.send('message %d' % i)
+        for i in xrange(100):
+            assert conn.recv() == 'message %d' % i
+        assert not rings
+
+        # A sleeping reader is woken up
+        thread = Thread(target=lambda: conn.send(conn.recv()))
+        thread.start()
+        while not conn._rx.sleeping:
+            time.sleep(0.001)
+        client.send('wake')
+        assert client.recv() == 'wake'
+        thread.join()
+        assert rings
+
+        conn.close()
+        client.close()
+        server.shutdown()
+        server.close()
+
+    def test_message_buffer(self):
+        a, b = socket_pair()
+        messages = MessageBuffer(16)
+
+        # Messages arrive whole however they are split
+        large = 'x'*100000 + '\n'
+        a.sendall('first\nsec')
+        assert messages.recv(b) == 'first\n'
+        a.sendall('ond\n' + large[:50])
+        assert messages.recv(b) == 'second\n'
+        Thread(target=lambda: a.sendall(large[50:])).start()
+        assert messages.recv(b) == large
+
+        a.close()
+        assert messages.recv(b) == ''
+        b.close()
+
+    @pytest.mark.parametrize('profile', sorted(SOCKET['tcp'].profiles))
+    def test_tcp_profile(self, profile):
+        address = 'localhost:1235'
+        server = DAPLinkServer(address=address, socket='tcp',
+                               interface='simulated', profile=profile)
+        server.init()
+
+        client = DAPLinkClient(address=address, socket='tcp', profile=profile,
+                               interface='simulated', create_server=False)
+        client.init()
+        assert client.ping() > 0
+        assert client.ping(size=2**20, payload=2**16) > 0
+        client.uninit()
+
+        server.uninit()
+
+    @pytest.mark.skipif(TCP_CORK is None, reason='needs TCP_CORK')
+    def test_tcp_cork(self):
+        import socket
+        from pyDAPLink.socket.tcp_socket import TCPConnection
+
+        listener = socket.socket()
+        listener.bind(('localhost', 0))
+        listener.listen(1)
+        a = socket.create_connection(listener.getsockname())
+        b, _ = listener.accept()
+        listener.close()
+
+        # The batch stays corked between messages and is sent on flush
+        conn = TCPConnection(a, 'batch')
+        conn.send('first\n')
+        conn.send('second\n')
+        conn.flush()
+        assert a.getsockopt(socket.IPPROTO_TCP, TCP_CORK)
+        messages = MessageBuffer()
+        assert messages.recv(b) == 'first\n'
+        assert messages.recv(b) == 'second\n'
+
+        conn.close()
+        b.close()
@@ -0,0 +1,426 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import os
+import pty
+import tty
+import pytest
+from pyDAPLink.interface import SimulatedUSB, ReplayUSB
+from pyDAPLink.interface import hidraw_backend, hidapi_backend
+from pyDAPLink.interface.hidraw_backend import HidrawUSB
+from pyDAPLink.interface.hidapi_backend import HidApiUSB
+from pyDAPLink.interface.pyusb_backend import EventLoop
+from pyDAPLink.interface.hid_report import reportSizes
+from pyDAPLink.interface.trace import TraceRecorder, TraceInterface, load
+from pyDAPLink.interface.trace import TRACE_WRITE, TRACE_READ
+from pyDAPLink.daplink import DAPLinkCore, DP_REG
+from pyDAPLink.errors import TransferError, TimeoutError
+from random import randint
+from time import time, sleep
+import threading
+
+
+# Some board definitions specific to Cortex-M parts for tests.
+CPWRUPREQ = 0x50000000
+CPWRUPACK = 0xa0000000
+DCRDR = 0xE000EDF8
+
+
+def hidDescriptor(size):
+    """ Vendor defined report descriptor used by CMSIS-DAP probes """
+    count = [0x95, size] if size < 0x100 else [0x96, size & 0xff, size >> 8]
+    return bytearray([0x06, 0x00, 0xff, 0x09, 0x01, 0xa1, 0x01,
+                      0x15, 0x00, 0x26, 0xff, 0x00, 0x75, 0x08] +
+                     count + [0x09, 0x01, 0x81, 0x02] +
+                     count + [0x09, 0x01, 0x91, 0x02] +
+                     [0x95, 0x01, 0x09, 0x01, 0xb1, 0x02, 0xc0])
+
+
+class HidApiDevice(object):
+    """ Stands in for a hid.device backed by a simulated probe """
+    def __init__(self, probe, descriptor=None):
+        self.probe = probe
+        self.descriptor = descriptor
+        self.path = None
+        self.reports = []
+        self.responses = []
+
+    def get_report_descriptor(self):
+        if self.descriptor is None:
+            raise IOError('Report descriptor not available')
+        return self.descriptor
+
+    def open_path(self, path):
+        self.path = path
+
+    def close(self):
+        self.path = None
+
+    def write(self, report):
+        self.reports.append(bytearray(report))
+        self.responses.append(self.probe.command(list(report[1:])))
+
+    def read(self, size, timeout_ms=0):
+        return self.responses.pop(0)[:size]
+
+
+@pytest.fixture
+def simulated(request):
+    """ Reconfigures simulated probes, restoring defaults afterwards """
+    def configure(**options):
+        SimulatedUSB.configure(**options)
+        interface = SimulatedUSB.getConnectedInterfaces(0x0d28, 0x0204)[0]
+        interface.open()
+        return interface
+
+    def cleanup():
+        SimulatedUSB.configure(latency=0.0, fault=0.0, stall=0.0,
+                               packet_size=64)
+    request.addfinalizer(cleanup)
+    return configure
+
+
+class TestSimulated:
+    def test_simulated_memory(self, simulated):
+        dap = DAPLinkCore(simulated())
+        dap.init()
+
+        assert dap.info('PACKET_SIZE') == 64
+        assert dap.info('SERIAL_NUMBER') == 'SIM0000'
+
+        dap.writeDP(DP_REG['SELECT'], 0)
+        dap.writeDP(DP_REG['CTRL_STAT'], CPWRUPREQ)
+        dap.readDP(DP_REG['CTRL_STAT'])
+        assert dap.flush()[0] & CPWRUPACK == CPWRUPACK
+
+        data = [randint(0, 0xffffffff) for i in xrange(100)]
+        dap.writeBlock32(0x20000000, data)
+        dap.readBlock32(0x20000000, len(data))
+        assert dap.flush() == [data]
+
+        dap.writeMem(0x20000001, 0xab, 8)
+        dap.readMem(0x20000001, 8)
+        dap.readMem(0x20000000, 16)
+        assert dap.flush() == [0xab, (data[0] & 0xff) | 0xab00]
+
+        dap.uninit()
+
+    def test_simulated_wait(self, simulated):
+        recorder = TraceRecorder()
+        dap = DAPLinkCore(TraceInterface(simulated(), recorder))
+        dap.init()
+        dap.writeDP(DP_REG['SELECT'], 0)
+        dap.writeDP(DP_REG['CTRL_STAT'], CPWRUPREQ)
+        dap.readDP(DP_REG['IDCODE'])
+        dap.writeMem(0x20000000, 0x12345678)
+        dap.flush()
+        recorder.clear()
+
+        # The probe matches the value, a single transfer is needed
+        assert dap.waitForValue(DP_REG['CTRL_STAT'], CPWRUPACK, CPWRUPACK,
+                                'dp') == CPWRUPACK
+        assert len(recorder) == 2
+        assert dap.waitForValue(0x20000000, 0xffff, 0x5678) == 0x5678
+        assert dap.waitForValue(0x20000002, 0xff, 0x34, 8) == 0x34
+        assert dap.waitForValue(0x20000002, 0xffff, 0x1234, 16) == 0x1234
+        # Bits of value outside of mask are ignored
+        assert dap.waitForValue(0x20000000, 0xff, 0xff78) == 0x78
+
+        # Mismatches are polled from the host until the timeout
+        start = time()
+        assert dap.waitForValue(0x20000000, 0xff, 0x00,
+                                interval=5, timeout=20) == 0x12345678
+        assert time() - start >= 0.02
+
+        # Pending reads are left for flush
+        dap.readMem(0x20000000)
+        dap.waitForValue(0x20000000, 0xff, 0x00, timeout=0)
+        assert dap.flush() == [0x12345678]
+
+    def test_simulated_threads(self, simulated):
+        simulated(boards=4)
+        threads = threading.active_count()
+
+        # Open boards don't cost threads
+        daps = [DAPLinkCore(board) for board
+                in SimulatedUSB.getConnectedInterfaces(0x0d28, 0x0204)]
+        for dap in daps:
+            dap.interface.open()
+            dap.init()
+        assert threading.active_count() == threads
+
+        for dap in daps:
+            dap.uninit()
+            dap.interface.close()
+        assert threading.active_count() == threads
+        SimulatedUSB.configure(boards=1)
+
+    def test_simulated_latency(self, simulated):
+        dap = DAPLinkCore(simulated(latency=0.01))
+
+        start = time()
+        dap.info('PACKET_COUNT')
+        assert time() - start >= 0.01
+
+    def test_simulated_faults(self, simulated):
+        dap = DAPLinkCore(simulated(fault=1.0))
+        dap.init()
+
+        with pytest.raises(TransferError):
+            dap.readBlock32(0x20000000, 4)
+
+    def test_simulated_timeout(self, simulated):
+        dap = DAPLinkCore(simulated(stall=1.0), timeout=10)
+
+        start = time()
+        with pytest.raises(TimeoutError):
+            dap.info('PACKET_COUNT')
+        assert time() - start < 1.0
+
+    @pytest.mark.parametrize('packet_size', [64, 512])
+    def test_simulated_packet_size(self, simulated, packet_size):
+        recorder = TraceRecorder(packet_size=packet_size)
+        dap = DAPLinkCore(TraceInterface(simulated(packet_size=packet_size),
+                                         recorder))
+        dap.init()
+        dap.writeDP(DP_REG['SELECT'], 0)
+        dap.writeDP(DP_REG['CTRL_STAT'], CPWRUPREQ)
+        dap.flush()
+        recorder.clear()
+
+        data = [randint(0, 0xffffffff) for i in xrange(1000)]
+        dap.writeBlock32(0x20000000, data)
+        dap.readBlock32(0x20000000, len(data))
+        assert dap.flush() == [data]
+
+        # Blocks are split into as few packets as fit the packet size
+        writes = len(recorder) // 2
+        assert writes <= 2*(-(-len(data) // ((packet_size-5)//4))) + 4
+
+        for i in xrange(100):
+            dap.writeMem(DCRDR, i)
+            dap.readMem(DCRDR)
+        assert dap.flush() == range(100)
+
+
+class HidApi(object):
+    """ Stands in for the hid module """
+    def __init__(self, probe=None, descriptor=None, devices=[]):
+        self.probe = probe
+        self.descriptor = descriptor
+        self.devices = devices
+        self.opened = []
+
+    def enumerate(self, vid, pid):
+        return [info for info in self.devices
+                if (info.get('vendor_id'), info.get('product_id')) == (vid, pid)]
+
+    def device(self):
+        device = HidApiDevice(self.probe, self.descriptor)
+        self.opened.append(device)
+        return device
+
+
+class TestHidApi:
+    @pytest.mark.parametrize('size', [64, 512, 1024])
+    def test_report_sizes(self, size):
+        assert reportSizes(hidDescriptor(size)) == (size, size)
+
+    def test_hidapi_enumerate(self, monkeypatch):
+        info = {'manufacturer_string': 'ARM',
+                'product_string': 'DAPLink CMSIS-DAP',
+                'vendor_id': 0x0d28, 'product_id': 0x0204}
+        hid = HidApi(descriptor=hidDescriptor(64),
+                     devices=[dict(info, path='0001', serial_number='A'),
+                              dict(info, path='0002'),
+                              dict(info, path='0003', serial_number='C')])
+        monkeypatch.setattr(hidapi_backend, 'hid', hid, raising=False)
+
+        # Devices missing information are skipped, and none are opened
+        boards = HidApiUSB.getConnectedInterfaces(0x0d28, 0x0204)
+        assert [board.serial_number for board in boards] == ['A', 'C']
+        assert hid.opened == []
+
+        boards[1].open()
+        assert [device.path for device in hid.opened] == ['0003']
+        boards[1].close()
+        assert hid.opened[0].path is None
+
+    @pytest.mark.parametrize('descriptor', [True, False])
+    def test_hidapi_report_size(self, simulated, monkeypatch, descriptor):
+        probe = simulated(packet_size=512).probe
+        monkeypatch.setattr(hidapi_backend, 'hid', HidApi(
+                probe, hidDescriptor(512) if descriptor else None),
+                raising=False)
+
+        interface = HidApiUSB()
+        interface.open()
+        assert interface.getPacketSize() == 512
+        # Without a descriptor the size is queried with a 64 byte report
+        assert [len(report) for report in interface.device.reports] == \
+                ([] if descriptor else [65])
+        del interface.device.reports[:]
+
+        dap = DAPLinkCore(interface)
+        dap.init()
+        dap.writeDP(DP_REG['SELECT'], 0)
+        dap.writeDP(DP_REG['CTRL_STAT'], CPWRUPREQ)
+        data = [randint(0, 0xffffffff) for i in xrange(200)]
+        dap.writeBlock32(0x20000000, data)
+        dap.readBlock32(0x20000000, len(data))
+        assert dap.flush() == [data]
+
+        # Reports are zero padded to the report size
+        reports = interface.device.reports
+        assert all(len(report) == 513 for report in reports)
+        assert reports[-1][6:] == bytearray(507)
+
+
+class TestHidraw:
+    def test_hidraw_enumerate(self, tmpdir, monkeypatch):
+        # sysfs links each hidraw node to its HID device, which is a
+        # child of the USB interface, which is a child of the USB device
+        hidraw = tmpdir.mkdir('hidraw')
+        for node, hid_id in [('hidraw0', '0003:00000D28:00000204'),
+                             ('hidraw1', '0003:0000046D:0000C52B')]:
+            usb = tmpdir.mkdir('usb-' + node)
+            usb.join('manufacturer').write('ARM\n')
+            device = usb.mkdir('intf').mkdir('hid')
+            device.join('uevent').write(
+                    'HID_ID=%s\nHID_NAME=ARM DAPLink CMSIS-DAP\n'
+                    'HID_UNIQ=SERIAL%s\n' % (hid_id, node[-1]))
+            device.join('report_descriptor').write_binary(
+                    str(hidDescriptor(1024)))
+            hidraw.mkdir(node).join('device').mksymlinkto(device)
+
+        monkeypatch.setattr(hidraw_backend, 'SYSFS_PATH', str(hidraw))
+        boards = HidrawUSB.getConnectedInterfaces(0x0d28, 0x0204)
+
+        assert len(boards) == 1
+        assert boards[0].path == '/dev/hidraw0'
+        assert boards[0].serial_number == 'SERIAL0'
+        assert boards[0].vendor_name == 'ARM'
+        assert boards[0].product_name == 'ARM DAPLink CMSIS-DAP'
+        assert boards[0].getPacketSize() == 1024
+
+    def test_hidraw_pty(self, request):
+        # A pty stands in for the device node
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        request.addfinalizer(lambda: os.close(master))
+
+        interface = HidrawUSB()
+        interface.path = os.ttyname(slave)
+        interface.open()
+        os.close(slave)
+        request.addfinalizer(interface.close)
+
+        interface.write([0x00, 0x01])
+        report = bytearray(os.read(master, 65))
+        assert report == bytearray([0, 0x00, 0x01] + [0]*62)
+
+        # Shorter packets reuse the report buffer without leftovers
+        interface.write([0x03])
+        report = bytearray(os.read(master, 65))
+        assert report == bytearray([0, 0x03] + [0]*63)
+
+        os.write(master, bytearray([0x00, 0x05] + [0]*62))
+        assert interface.read(timeout=1000)[:2] == bytearray([0x00, 0x05])
+
+        with pytest.raises(IOError):
+            interface.read(timeout=10)
+
+
+class TestEventLoop:
+    def test_event_loop_threads(self):
+        loop = EventLoop(lambda: sleep(0.001))
+        threads = threading.active_count()
+
+        # All open boards share one thread
+        for _ in xrange(8):
+            loop.acquire()
+        assert threading.active_count() == threads + 1
+
+        for _ in xrange(8):
+            loop.release()
+        assert threading.active_count() == threads
+
+        # The thread starts again with the next open board
+        loop.acquire()
+        assert threading.active_count() == threads + 1
+        loop.release()
+        assert threading.active_count() == threads
+
+
+class TestTrace:
+    @pytest.mark.parametrize('count', [0, 5, 8, 13])
+    def test_trace_dump(self, tmpdir, count):
+        recorder = TraceRecorder(capacity=8, packet_size=16)
+        packets = [[randint(0, 0xff) for i in xrange(randint(1, 24))]
+                   for i in xrange(count)]
+
+        for i, packet in enumerate(packets):
+            recorder.record(TRACE_WRITE if i % 2 == 0 else TRACE_READ, packet)
+
+        path = str(tmpdir.join('trace.dapt'))
+        recorder.dump(path)
+        packet_size, records = load(path)
+
+        assert packet_size == 16
+        assert len(records) == min(count, 8)
+        assert all(a[0] <= b[0] for a, b in zip(records, records[1:]))
+
+        for packet, (_, direction, length, data) in zip(packets[-8:], records):
+            assert length == len(packet)
+            assert list(data) == packet[:16]
+
+
+class TestReplay:
+    def workload(self, dap, data):
+        dap.init()
+        dap.writeBlock32(0x20000000, data)
+        dap.readBlock32(0x20000000, len(data))
+        dap.readMem(0x20000000)
+        results = dap.flush()
+        dap.uninit()
+        return results
+
+    @pytest.mark.parametrize('timing', [False, True])
+    def test_replay(self, request, simulated, tmpdir, timing):
+        data = [randint(0, 0xffffffff) for i in xrange(100)]
+        path = str(tmpdir.join('session.dapt'))
+
+        recorder = TraceRecorder()
+        recorded = self.workload(
+                DAPLinkCore(TraceInterface(simulated(latency=0.001), recorder)),
+                data)
+        recorder.dump(path)
+
+        ReplayUSB.configure(traces=[path], timing=timing)
+        request.addfinalizer(lambda: ReplayUSB.configure(traces=[], timing=False))
+        interface = ReplayUSB.getConnectedInterfaces(0x0d28, 0x0204)[0]
+        interface.open()
+
+        start = time()
+        assert self.workload(DAPLinkCore(interface), data) == recorded
+        if timing:
+            assert time() - start >= 0.001*len(recorder)/2
+
+        # Diverging from the recorded commands is an error
+        interface.open()
+        with pytest.raises(IOError):
+            self.workload(DAPLinkCore(interface), data[::-1])
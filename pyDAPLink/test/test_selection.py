@@ -0,0 +1,187 @@
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2006-2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import pytest
+from pyDAPLink.interface import SimulatedUSB
+from pyDAPLink.server.registry import DeviceRegistry
+from pyDAPLink.server.index import BoardIndex
+from pyDAPLink.server.selection import IfSelection
+from threading import Thread, Event
+from time import sleep
+
+
+VID = 0x0d28
+PID = 0x0204
+
+
+@pytest.fixture
+def scans(request, monkeypatch):
+    """ Counts scans of simulated probes """
+    scans = []
+    scan = SimulatedUSB.getConnectedInterfaces
+
+    def counted(vid, pid):
+        scans.append((vid, pid))
+        return scan(vid, pid)
+    monkeypatch.setattr(SimulatedUSB, 'getConnectedInterfaces',
+                        staticmethod(counted))
+
+    request.addfinalizer(lambda: SimulatedUSB.configure(boards=1))
+    return scans
+
+def selection():
+    """ Selection unshared with other tests, as after a restart """
+    selection = object.__new__(IfSelection)
+    selection.__init__(VID, PID)
+    return selection
+
+
+class TestRegistry:
+    def test_registry_cached(self, scans):
+        registry = DeviceRegistry(SimulatedUSB)
+        registry.invalidate()
+
+        boards = registry.interfaces(VID, PID)
+        assert registry.interfaces(VID, PID) is boards
+        assert len(scans) == 1
+
+    def test_registry_hotplug(self, scans):
+        registry = DeviceRegistry(SimulatedUSB)
+        SimulatedUSB.configure(boards=1)
+        assert len(registry.interfaces(VID, PID)) == 1
+
+        # Configuring the simulated probes notifies the registry
+        SimulatedUSB.configure(boards=3)
+        assert len(registry.interfaces(VID, PID)) == 3
+        assert len(registry.interfaces(VID, PID)) == 3
+        assert len(scans) == 2
+
+    def test_registry_refresh(self, scans, monkeypatch):
+        registry = DeviceRegistry(SimulatedUSB)
+        registry.invalidate()
+        monkeypatch.setattr(registry, 'interval', 0.0)
+
+        registry.interfaces(VID, PID)
+        registry.interfaces(VID, PID)
+        assert len(scans) == 2
+
+
+class TestSelection:
+    def test_selection_single_flight(self, scans, monkeypatch):
+        scan = SimulatedUSB.getConnectedInterfaces
+        def slow(vid, pid):
+            sleep(0.1)
+            return scan(vid, pid)
+        monkeypatch.setattr(SimulatedUSB, 'getConnectedInterfaces',
+                            staticmethod(slow))
+        DeviceRegistry(SimulatedUSB).invalidate()
+
+        selection = IfSelection(VID, PID)
+        threads = [Thread(target=selection.enumerate, args=(SimulatedUSB,))
+                   for i in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(scans) == 1
+        assert len(selection.ids()) >= 1
+
+    def test_selection_lookup_during_enumerate(self, scans, monkeypatch):
+        selection = IfSelection(VID, PID)
+        selection.enumerate(SimulatedUSB)
+        id = selection.ids()[0]
+
+        release = Event()
+        scan = SimulatedUSB.getConnectedInterfaces
+        def blocked(vid, pid):
+            release.wait()
+            return scan(vid, pid)
+        monkeypatch.setattr(SimulatedUSB, 'getConnectedInterfaces',
+                            staticmethod(blocked))
+        DeviceRegistry(SimulatedUSB).invalidate()
+
+        thread = Thread(target=selection.enumerate, args=(SimulatedUSB,))
+        thread.start()
+        try:
+            # Lookups and selection don't wait for the enumeration
+            assert id in selection.ids()
+            assert selection[id] is not None
+            assert selection.select(id) is selection[id]
+            selection.deselect(id)
+        finally:
+            release.set()
+            thread.join()
+
+        assert id in selection.ids()
+
+
+class TestIndex:
+    def test_index_lookup(self, tmpdir):
+        path = str(tmpdir.join('ids.json'))
+        index = BoardIndex(path)
+        index.assign(VID, PID, 'SERIAL', '1-2', 3)
+        index.assign(VID, PID, '', '1-3', 4)
+        index.save()
+
+        index = BoardIndex(path)
+        assert index.ids(VID, PID) == set([3, 4])
+        assert index.lookup(VID, PID, 'SERIAL', '1-2') == 3
+        assert index.lookup(VID, PID, 'SERIAL', '1-4') == 3
+        assert index.lookup(VID, PID, '', '1-3') == 4
+        assert index.lookup(VID, PID, 'OTHER', '1-3') is None
+        assert index.lookup(VID, PID+1, 'SERIAL', '1-2') is None
+
+    def test_index_merge(self, tmpdir):
+        path = str(tmpdir.join('ids.json'))
+        first = BoardIndex(path)
+        second = BoardIndex(path)
+        first.assign(VID, PID, 'FIRST', '1-2', 1)
+        second.assign(VID, PID, 'SECOND', '1-3', 2)
+        first.save()
+        second.save()
+
+        # Servers sharing the index keep each other's boards
+        index = BoardIndex(path)
+        assert index.ids(VID, PID) == set([1, 2])
+
+        # A board given a new id frees its old one
+        index.assign(VID, PID, 'FIRST', '1-4', 3)
+        index.save()
+        assert BoardIndex(path).ids(VID, PID) == set([2, 3])
+
+    def test_index_selection(self, scans, tmpdir):
+        path = str(tmpdir.join('ids.json'))
+        index = BoardIndex(path)
+        index.assign(VID, PID, 'SIM0002', None, 7)
+        index.save()
+
+        SimulatedUSB.configure(boards=3)
+        first = selection()
+        first.enumerate(SimulatedUSB, BoardIndex(path))
+        ids = dict((first[id].serial_number, id) for id in first.ids())
+        assert ids['SIM0002'] == 7
+        assert sorted(ids.values()) == [1, 2, 7]
+
+        # Ids survive a restart with boards enumerated in any order
+        SimulatedUSB.configure(boards=1)
+        restarted = selection()
+        restarted.enumerate(SimulatedUSB, BoardIndex(path))
+        SimulatedUSB.configure(boards=3)
+        restarted.enumerate(SimulatedUSB, BoardIndex(path))
+        assert dict((restarted[id].serial_number, id)
+                    for id in restarted.ids()) == ids
@@ -17,6 +17,7 @@
 
 import pytest
 from pyDAPLink.utility import encode, decode
+from pyDAPLink.utility.encoding import MAX_MESSAGE
 from pyDAPLink.utility import UniqueType
 from pyDAPLink.utility import socket_pair
 from numbers import Integral
@@ -47,6 +48,20 @@ class TestEncodings:
         assert isinstance(decoding['int'],  Integral)
         assert isinstance(decoding['list'], list)
 
+    def test_compression(self):
+        command = {'command': 'write', 'data': range(1000)}
+
+        encoding = encode(command, 100)
+        assert 'zlib' in encoding
+        assert decode(encoding, True) == command
+        # Compression has to be negotiated
+        assert decode(encoding) != command
+
+        # Messages can't expand without bound
+        bomb = encode({'padding': ' '*(MAX_MESSAGE + 1)}, 0)
+        with pytest.raises(ValueError):
+            decode(bomb, True)
+
 
 class TestUniqueType:
     @pytest.mark.parametrize('arg_count', [1, 2, 4])
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+from pyDAPLink import __version__
+from pyDAPLink import DAPLinkServer, DAPLinkClient
+from pyDAPLink.daplink import CMSIS_DAP, DAPLinkCore, DP_REG
+from pyDAPLink.daplink.protocol import COMMAND_ID
+from pyDAPLink.interface import SimulatedUSB
+from pyDAPLink.interface.simulated_backend import OPTIONS
+from pyDAPLink.interface.interface import Interface
+from pyDAPLink.socket import SOCKET
+from pyDAPLink.socket.tcp_socket import PROFILES, DEFAULT_PROFILE
+from pyDAPLink.utility import encode, decode
+
+
+VID = 0x0d28
+PID = 0x0204
+DCRDR = 0xE000EDF8
+CPWRUPREQ = 0x50000000
+
+READ = 1 << 1
+AP_DRW_READ = READ | 1 | 0x0c
+
+
+parser = argparse.ArgumentParser(description='pyDAPLink host side benchmarks')
+parser.add_argument('--version', action='version', version=__version__)
+parser.add_argument('-o', '--output',
+                    help="Write results as JSON to this file.")
+parser.add_argument('-c', '--compare',
+                    help="Compare results against a baseline JSON file.")
+parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                    help="Relative slowdown reported as a regression.")
+parser.add_argument('-r', '--repeat', type=int, default=5,
+                    help="Number of times each benchmark is repeated.")
+parser.add_argument('-l', '--latency', type=float, default=0.0,
+                    help="Per packet latency of the simulated probe.")
+parser.add_argument('-k', '--filter', default='',
+                    help="Only run benchmarks containing this string.")
+
+
+class EchoInterface(Interface):
+    """
+    Answers every command immediately with a successful, zero filled
+    response, so only the host side of the protocol is measured.
+    """
+    name = 'echo'
+
+    def __init__(self, packet_count=4):
+        super(EchoInterface, self).__init__()
+        self.packet_count = packet_count
+        self._pending = []
+
+    def write(self, data):
+        if data[0] == COMMAND_ID['DAP_TRANSFER']:
+            resp = [data[0], data[2], 1]
+        elif data[0] == COMMAND_ID['DAP_TRANSFER_BLOCK']:
+            resp = [data[0], data[2], data[3], 1]
+        elif data[0] == COMMAND_ID['DAP_CONNECT']:
+            resp = [data[0], 1]
+        else:
+            resp = [data[0], 0]
+
+        self._pending.append(resp + [0]*(64 - len(resp)))
+
+    def read(self, timeout = -1):
+        return self._pending.pop(0)
+
+
+BENCHMARKS = []
+
+def benchmark(ops):
+    """
+    Decorator for benchmarks. Benchmarks take a setup context and
+    return a function that performs ops operations.
+    """
+    def decorator(func):
+        BENCHMARKS.append((func.__name__, ops, func))
+        return func
+    return decorator
+
+
+# CMSIS_DAP packet encoding and decoding
+@benchmark(ops=1000)
+def protocol_transfer(context):
+    protocol = CMSIS_DAP(EchoInterface())
+    requests = [READ]*12
+
+    def run():
+        for _ in xrange(1000):
+            protocol.transfer(12, requests)
+    return run
+
+@benchmark(ops=4096)
+def protocol_transfer_block(context):
+    protocol = CMSIS_DAP(EchoInterface())
+
+    def run():
+        protocol.transferBlock(4096, AP_DRW_READ)
+    return run
+
+
+# DAPLinkCore queueing and flushing
+@benchmark(ops=1000)
+def core_write_mem(context):
+    dap = DAPLinkCore(EchoInterface())
+
+    def run():
+        for i in xrange(1000):
+            dap.writeMem(DCRDR, i)
+        dap.flush()
+    return run
+
+@benchmark(ops=1000)
+def core_read_mem(context):
+    dap = DAPLinkCore(EchoInterface())
+
+    def run():
+        for _ in xrange(1000):
+            dap.readMem(DCRDR)
+        dap.flush()
+    return run
+
+@benchmark(ops=4096)
+def core_read_block(context):
+    dap = DAPLinkCore(EchoInterface())
+
+    def run():
+        dap.readBlock32(0x20000000, 4096)
+        dap.flush()
+    return run
+
+
+# JSON encoding and decoding
+@benchmark(ops=1000)
+def json_command(context):
+    def run():
+        for i in xrange(1000):
+            decode(encode({'command': 'write_32', 'addr': DCRDR, 'data': i}))
+    return run
+
+@benchmark(ops=4096)
+def json_block(context):
+    words = range(0x80000000, 0x80000000 + 4096)
+
+    def run():
+        decode(encode({'response': 'flush', 'reads': [words]}))
+    return run
+
+
+# Full client to server round trips, over each socket type
+# and each TCP profile
+TRANSPORTS = [(socket_type, socket_type, None)
+              for socket_type in ('unix', 'shm', 'tcp')
+              if socket_type in SOCKET]
+TRANSPORTS += [('tcp_%s' % profile, 'tcp', profile)
+               for profile in sorted(PROFILES)
+               if profile != DEFAULT_PROFILE]
+
+def round_trip(transport):
+    def ping(context):
+        client = context.client(transport)
+
+        def run():
+            for _ in xrange(100):
+                client.ping()
+        return run
+
+    def throughput(context):
+        client = context.client(transport)
+
+        def run():
+            client.ping(size=2**20)
+        return run
+
+    def read_mem(context):
+        board = context.board(transport)
+
+        def run():
+            for _ in xrange(100):
+                board.readMem(DCRDR)
+        return run
+
+    def read_block(context):
+        board = context.board(transport)
+
+        def run():
+            board.readBlock32(0x20000000, 4096)
+        return run
+
+    for name, ops, func in [('ping', 100, ping),
+                            ('throughput', 2**20, throughput),
+                            ('read_mem', 100, read_mem),
+                            ('read_block', 4096, read_block)]:
+        BENCHMARKS.append(('%s_%s' % (transport[0], name), ops, func))
+
+for transport in TRANSPORTS:
+    round_trip(transport)
+
+
+class Context(object):
+    """
+    Lazily creates in-process servers backed by simulated probes,
+    each transport gets its own probe.
+    """
+    def __init__(self):
+        self._tmpdir = tempfile.mkdtemp(prefix='pydaplink-bench-')
+        self._servers = {}
+        self._clients = {}
+        self._boards = {}
+
+    def _address(self, transport):
+        name, socket_type, _ = transport
+        if socket_type != 'tcp':
+            return os.path.join(self._tmpdir, name)
+
+        # Find a free port
+        probe = socket.socket()
+        probe.bind(('localhost', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        return 'localhost:%d' % port
+
+    def client(self, transport):
+        if transport not in self._clients:
+            _, socket_type, profile = transport
+            address = self._address(transport)
+            server = DAPLinkServer(address, socket=socket_type,
+                                   interface='simulated', profile=profile)
+            server.init()
+            self._servers[transport] = server
+
+            client = DAPLinkClient(address, socket=socket_type,
+                                   interface='simulated', create_server=False,
+                                   profile=profile)
+            client.init()
+            self._clients[transport] = client
+
+        return self._clients[transport]
+
+    def board(self, transport):
+        if transport not in self._boards:
+            client = self.client(transport)
+            board = client.getConnectedBoards(VID, PID)[len(self._boards)]
+            board.init(new_socket=False)
+            board.writeDP(DP_REG['SELECT'], 0)
+            board.writeDP(DP_REG['CTRL_STAT'], CPWRUPREQ)
+            self._boards[transport] = board
+
+        return self._boards[transport]
+
+    def close(self):
+        for board in self._boards.values():
+            board.uninit()
+        for client in self._clients.values():
+            client.uninit()
+        for server in self._servers.values():
+            server.uninit()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+def run(repeat, filter='', latency=0.0):
+    """ Runs the benchmarks, returns a dictionary of results. """
+    # The simulated probes are shared by the process, restored afterwards
+    previous = {'latency': OPTIONS['latency'], 'boards': OPTIONS['boards']}
+    SimulatedUSB.configure(latency=latency, boards=len(TRANSPORTS))
+    context = Context()
+    results = {}
+
+    try:
+        for name, ops, func in BENCHMARKS:
+            if filter not in name:
+                continue
+
+            bench = func(context)
+            # Warm up
+            bench()
+
+            times = []
+            for _ in xrange(repeat):
+                start = timer()
+                bench()
+                times.append((timer() - start) / ops)
+
+            times.sort()
+            results[name] = {'ops': ops,
+                             'best': times[0],
+                             'median': times[len(times)//2]}
+    finally:
+        context.close()
+        SimulatedUSB.configure(**previous)
+
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Compares median times against a baseline,
+    returns the names of regressed benchmarks.
+    """
+    regressions = []
+
+    print '%-24s %12s %12s %8s' % ('benchmark', 'baseline', 'current', 'change')
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+
+        before = baseline[name]['median']
+        after = results[name]['median']
+        change = after/before - 1 if before else 0.0
+        regressed = change > threshold
+
+        print '%-24s %10.3fus %10.3fus %+7.1f%%%s' % (
+                name, 1e6*before, 1e6*after, 100*change,
+                ' REGRESSION' if regressed else '')
+
+        if regressed:
+            regressions.append(name)
+
+    return regressions
+
+def main():
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.filter, args.latency)
+
+    print '%-24s %12s %12s' % ('benchmark', 'best', 'median')
+    for name in sorted(results):
+        print '%-24s %10.3fus %10.3fus' % (name,
+                1e6*results[name]['best'], 1e6*results[name]['median'])
+    print
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'version': __version__,
+                       'python': platform.python_version(),
+                       'latency': args.latency,
+                       'repeat': args.repeat,
+                       'results': results},
+                      file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+        if baseline.get('latency') != args.latency:
+            print 'warning: baseline was measured with %s latency' % (
+                    baseline.get('latency'))
+
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print '%d benchmark(s) regressed' % len(regressions)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,8 @@ from pyDAPLink import __version__
 from pyDAPLink import DAPLinkServer
 from pyDAPLink.socket import SOCKET
 from pyDAPLink.interface import INTERFACE
+from pyDAPLink.server.index import DEFAULT_INDEX
+from pyDAPLink.socket.tcp_socket import PROFILES
 
 
 parser = argparse.ArgumentParser(description='pyDAPLink server')
@@ -36,8 +38,23 @@ parser.add_argument('-a', '--address',
                     help="Specify location to use as address for socket.")
 parser.add_argument('-s', '--socket', choices=SOCKET.keys(),
                     help="Specify socket type.")
+parser.add_argument('-p', '--profile', choices=PROFILES.keys(),
+                    help="Specify TCP socket profile.")
 parser.add_argument('-i', '--interface', choices=INTERFACE.keys(),
                     help="Specify interface.")
+parser.add_argument('--stats-address',
+                    help="Serve statistics as text over http on this address.")
+parser.add_argument('--trace',
+                    help="Record packets and dump them to this directory on errors.")
+parser.add_argument('--trace-capacity', type=int, default=4096,
+                    help="Number of packets kept per board when tracing.")
+parser.add_argument('--index', default=DEFAULT_INDEX,
+                    help="File that keeps board ids across restarts.")
+parser.add_argument('--session-idle', type=float, default=0,
+                    help="Keep initialized boards for this many seconds "
+                         "after clients release them.")
+parser.add_argument('--workers', action='store_true', default=False,
+                    help="Run each initialized board in its own process.")
 parser.add_argument('--temporary', action='store_true', default=False,
                     help="Exit if no clients are connected.")
 
@@ -51,7 +68,14 @@ def main():
 
     server = DAPLinkServer(args.address, 
                            socket=args.socket, 
-                           interface=args.interface)
+                           interface=args.interface,
+                           stats_address=args.stats_address,
+                           trace=args.trace,
+                           trace_capacity=args.trace_capacity,
+                           index=args.index,
+                           session_idle=args.session_idle,
+                           workers=args.workers,
+                           profile=args.profile)
     server.init()
     print 'pyDAPLink server running'
 
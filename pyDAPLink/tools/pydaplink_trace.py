@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+ mbed CMSIS-DAP debugger
+ Copyright (c) 2015 ARM Limited
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import argparse
+from collections import Counter
+
+from pyDAPLink import __version__
+from pyDAPLink.daplink.protocol import COMMAND_ID
+from pyDAPLink.interface.trace import load, TRACE_WRITE, TRACE_READ
+
+
+COMMAND_NAME = {id: name for name, id in COMMAND_ID.items()}
+
+# Transfer request bits
+READ = 1 << 1
+VALUE_MATCH = 1 << 4
+
+
+parser = argparse.ArgumentParser(description='pyDAPLink trace summary')
+parser.add_argument('--version', action='version', version=__version__)
+parser.add_argument('trace', nargs='+',
+                    help="Trace files dumped by pydaplink-server.")
+
+
+def response_length(cmd, resp):
+    """
+    Length of the meaningful part of a response,
+    responses are padded to the packet size.
+    """
+    if resp[0] == COMMAND_ID['DAP_TRANSFER']:
+        # Only requests up to the response count are executed
+        count, offset, length = resp[1], 3, 3
+        for _ in xrange(count):
+            if offset >= len(cmd):
+                break
+            request = cmd[offset]
+            offset += 1
+            if not request & READ or request & VALUE_MATCH:
+                offset += 4
+            if request & READ and not request & VALUE_MATCH:
+                length += 4
+        return length
+    elif resp[0] == COMMAND_ID['DAP_TRANSFER_BLOCK']:
+        if cmd[4] & READ:
+            return 4 + 4*(resp[1] | (resp[2] << 8))
+        return 4
+    elif resp[0] == COMMAND_ID['DAP_INFO']:
+        return 2 + resp[1]
+    else:
+        return 2
+
+def percentile(values, p):
+    return values[min(int(p*len(values)), len(values)-1)]
+
+def summarize(path):
+    packet_size, records = load(path)
+
+    writes = [r for r in records if r[1] == TRACE_WRITE]
+    reads = [r for r in records if r[1] == TRACE_READ]
+
+    print '%s:' % path
+    if not records:
+        print '  empty trace'
+        return
+
+    duration = records[-1][0] - records[0][0]
+    print '  %d packets written, %d packets read over %.3f seconds' % (
+            len(writes), len(reads), duration)
+
+    # Responses are returned in order, so pair each
+    # read with the oldest unanswered write
+    pending = []
+    latencies = []
+    write_fill = []
+    read_fill = []
+    mix = Counter()
+
+    for timestamp, direction, length, data in records:
+        if direction == TRACE_WRITE:
+            pending.append((timestamp, data))
+            write_fill.append(float(length) / packet_size)
+            mix[COMMAND_NAME.get(data[0], '0x%02x' % data[0])] += 1
+        elif pending:
+            sent, cmd = pending.pop(0)
+            latencies.append(timestamp - sent)
+            read_fill.append(float(response_length(cmd, data)) / packet_size)
+
+    if latencies:
+        latencies.sort()
+        print '  round trip: min %.3f ms, median %.3f ms, p99 %.3f ms, max %.3f ms' % (
+                1e3*latencies[0], 1e3*percentile(latencies, 0.5),
+                1e3*percentile(latencies, 0.99), 1e3*latencies[-1])
+
+    if write_fill:
+        print '  write fill: %.1f%% of %d bytes' % (
+                100*sum(write_fill)/len(write_fill), packet_size)
+    if read_fill:
+        print '  read fill:  %.1f%% of %d bytes' % (
+                100*sum(read_fill)/len(read_fill), packet_size)
+
+    print '  command mix:'
+    for name, count in mix.most_common():
+        print '    %-24s %8d %5.1f%%' % (name, count, 100.0*count/len(writes))
+
+def main():
+    args = parser.parse_args()
+
+    for path in args.trace:
+        summarize(path)
+
+
+if __name__ == '__main__':
+    main()
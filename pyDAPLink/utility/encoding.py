@@ -16,12 +16,23 @@
 """
 
 from collections import OrderedDict
+import base64
 import json
+import zlib
+
+
+# Smallest message compressed by default once both ends support it,
+# smaller messages gain too little to be worth compressing
+COMPRESS_THRESHOLD = 4096
+
+# Largest message a compressed message may expand to
+MAX_MESSAGE = 64*1024*1024
 
 
 # Encoding and decoding of data over the network.
-# Expects all parameters to be in an instance of dictionary
-def encode(data):
+# Expects all parameters to be in an instance of dictionary.
+# If threshold is given, messages at least that long are compressed.
+def encode(data, threshold=None):
     assert isinstance(data, dict)
 
     # Even though ordered is unspecified, we put the 
@@ -30,9 +41,30 @@ def encode(data):
         return entry[0] not in ('command', 'response', 'error')
 
     ordered = OrderedDict(sorted(data.iteritems(), key=isnt_special))
-    return json.dumps(ordered, separators=(',',':')) + '\n'
+    data = json.dumps(ordered, separators=(',',':'))
+
+    # Compressed messages are base64 encoded to stay newline terminated
+    if threshold is not None and len(data) >= threshold:
+        data = json.dumps({'zlib': base64.b64encode(zlib.compress(data))},
+                          separators=(',',':'))
 
-def decode(data):
+    return data + '\n'
+
+# Compressed messages are only expanded if compression is set, since
+# compression is negotiated per connection.
+def decode(data, compression=False):
     data = json.loads(data)
     assert isinstance(data, dict)
+
+    if compression and 'zlib' in data:
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(base64.b64decode(data['zlib']),
+                                       MAX_MESSAGE)
+        if decompressor.unconsumed_tail:
+            raise ValueError('Compressed message larger than %d bytes'
+                             % MAX_MESSAGE)
+
+        data = json.loads(data)
+        assert isinstance(data, dict)
+
     return data
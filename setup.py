@@ -46,6 +46,8 @@ setup(
     entry_points={
         'console_scripts': [
             'pydaplink-server = pyDAPLink.tools.pydaplink_server:main',
+            'pydaplink-trace = pyDAPLink.tools.pydaplink_trace:main',
+            'pydaplink-bench = pyDAPLink.tools.pydaplink_bench:main',
         ],
     },
     use_2to3=True,